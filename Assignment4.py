@@ -14,9 +14,17 @@
 
 from util import manhattanDistance
 from game import Directions
-import random, util
+import random, util, time, os, multiprocessing
 
 from game import Agent
+from game import Actions, AgentState, Configuration, Grid
+from collections import OrderedDict, deque
+from instrumentation import CountingCall, Instrumentation
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 class ReflexAgent(Agent):
     """
@@ -86,6 +94,364 @@ def scoreEvaluationFunction(currentGameState):
     """
     return currentGameState.getScore()
 
+# Move orderings for AlphaBetaAgent, picked with e.g. -a ordering=static,killers
+MOVE_ORDERINGS = ('static', 'killers', 'history')
+
+# Width of the windows of principal variation search. The search is right for
+# any width, a value inside the window is exact; game scores are whole numbers.
+NULL_WINDOW = 1
+
+# Bound types of the values stored in a TranspositionTable
+EXACT, LOWER, UPPER = 0, 1, 2
+
+class TranspositionTable:
+    """
+      A bounded table of the values of game states that have already been
+      searched, so that a state reached again through a different order of
+      moves is not searched again.
+
+      Each entry is a tuple (value, depth, bound, action, depth_limited):
+      'depth' is the number of plies that were left to search below the
+      state, and 'bound' tells if 'value' is the EXACT value, or only a LOWER
+      or UPPER bound on it because the search was cut off by alpha-beta
+      pruning. 'depth_limited' tells if the search below the state stopped
+      at the depth limit anywhere, so that a deeper search would see more.
+
+      When the table is full, an entry is thrown out to make room:
+        - 'lru': the least recently used entry
+        - 'depth': the table is a fixed array of slots indexed by the hash of
+          the key, and a new entry only replaces the one in its slot if it was
+          searched at least as deep, so the most expensive results are kept
+
+      probes, hits, stores and evictions count how the table is used.
+    """
+
+    def __init__(self, size=100000, replacement='lru'):
+        if replacement not in ('lru', 'depth'):
+            raise ValueError('Unknown replacement scheme: %r' % (replacement,))
+        self.size = size
+        self.replacement = replacement
+        self.clear()
+
+    def clear(self):
+        self.entries = OrderedDict() if self.replacement == 'lru' else {}
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+        self.evictions = 0
+
+    def lookup(self, key):
+        """
+          Returns the entry stored for 'key', or None.
+        """
+        self.probes += 1
+        if self.replacement == 'lru':
+            entry = self.entries.pop(key, None)
+            if entry is None:
+                return None
+            self.entries[key] = entry
+        else:
+            slot = self.entries.get(hash(key) % self.size)
+            if slot is None or slot[0] != key:
+                return None
+            entry = slot[1]
+        self.hits += 1
+        return entry
+
+    def store(self, key, value, depth, bound, action=None, depth_limited=False):
+        entry = (value, depth, bound, action, depth_limited)
+        if self.replacement == 'lru':
+            self.entries.pop(key, None)
+            self.entries[key] = entry
+            if len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+        else:
+            index = hash(key) % self.size
+            slot = self.entries.get(index)
+            if slot is not None and slot[0] != key:
+                if slot[1][1] > depth:
+                    return
+                self.evictions += 1
+            self.entries[index] = (key, entry)
+        self.stores += 1
+
+    def hit_rate(self):
+        if self.probes == 0:
+            return 0.0
+        return self.hits / float(self.probes)
+
+    def __len__(self):
+        return len(self.entries)
+
+
+# The rules of the game, as in pacman.py
+SCARED_TIME = 40
+COLLISION_TOLERANCE = 0.7
+TIME_PENALTY = 1
+
+class SearchMaze:
+    """
+      The parts of a layout that stay the same through a game, shared by the
+      SearchStates of it: the walls, the moves that are possible from each
+      square, and the food grids made for evaluation functions.
+    """
+
+    def __init__(self, walls):
+        self.walls = walls
+        self.width = walls.width
+        self.height = walls.height
+        self.possible = {}
+        for x in range(walls.width):
+            for y in range(walls.height):
+                if not walls[x][y]:
+                    self.possible[(x, y)] = Actions.getPossibleActions(Configuration((x, y), Directions.STOP), walls)
+        self.ghost_moves = {}
+        self.grids = {}
+
+    def ghost_legal_actions(self, square, direction):
+        moves = self.ghost_moves.get((square, direction))
+        if moves is None:
+            moves = ghost_moves(self.possible[square], direction)
+            self.ghost_moves[(square, direction)] = moves
+        return moves
+
+    def food_grid(self, food):
+        """
+          The food of a SearchState (a number with a bit for each square) as
+          a Grid, for evaluation functions. The grids are cached by food, and
+          must not be changed.
+        """
+        grid = self.grids.get(food)
+        if grid is None:
+            if len(self.grids) > 1000:
+                self.grids.clear()
+            grid = Grid(self.width, self.height)
+            bits = food
+            while bits:
+                bit = bits & -bits
+                square = bit.bit_length() - 1
+                grid[square // self.height][square % self.height] = True
+                bits ^= bit
+            self.grids[food] = grid
+        return grid
+
+
+def ghost_moves(possible, direction):
+    # ghosts can not stop, or turn around unless they have to
+    moves = [move for move in possible if move != Directions.STOP]
+    reverse = Actions.reverseDirection(direction)
+    if reverse in moves and len(moves) > 1:
+        moves.remove(reverse)
+    return moves
+
+_search_mazes = {}
+
+def get_search_maze(walls):
+    # cached by the walls object, like get_maze_distances
+    cached = _search_mazes.get(id(walls))
+    if cached is None or cached[0] is not walls:
+        cached = (walls, SearchMaze(walls))
+        _search_mazes[id(walls)] = cached
+    return cached[1]
+
+
+class SearchState(object):
+    """
+      A small game state for use inside the search, made from a GameState at
+      the root. The agents are kept as tuples of positions, directions and
+      scared timers, and the food as a number with a bit for each square.
+
+      Moves are made in place with make(), following the rules of pacman.py,
+      and taken back with unmake(), so searching a move does not copy the
+      whole state the way GameState.generateSuccessor does. The GameState
+      methods that the agents and evaluation functions use are here too.
+      Lists returned by getLegalActions are shared, and must not be changed.
+    """
+    __slots__ = ('maze', 'starts', 'positions', 'directions', 'scared', 'food', 'food_count',
+                 'capsules', 'score', 'win', 'lose', 'trail')
+
+    def __init__(self, gameState=None):
+        if gameState is None:
+            return
+        agents = [gameState.getPacmanState()] + gameState.getGhostStates()
+        self.maze = get_search_maze(gameState.getWalls())
+        self.starts = tuple([(agent.start.getPosition(), agent.start.getDirection()) for agent in agents])
+        self.positions = tuple([agent.getPosition() for agent in agents])
+        self.directions = tuple([agent.getDirection() for agent in agents])
+        self.scared = tuple([agent.scaredTimer for agent in agents])
+        self.food = 0
+        food = gameState.getFood().asList()
+        for x, y in food:
+            self.food |= 1 << (x * self.maze.height + y)
+        self.food_count = len(food)
+        self.capsules = tuple(gameState.getCapsules())
+        self.score = gameState.getScore()
+        self.win = gameState.isWin()
+        self.lose = gameState.isLose()
+        self.trail = []
+
+    def copy(self):
+        state = SearchState()
+        for name in SearchState.__slots__:
+            setattr(state, name, getattr(self, name))
+        state.trail = []
+        return state
+
+    def make(self, agentIndex, action):
+        self.trail.append((self.positions, self.directions, self.scared, self.food, self.food_count,
+                           self.capsules, self.score, self.win, self.lose))
+        positions = list(self.positions)
+        directions = list(self.directions)
+        scared = list(self.scared)
+        x, y = positions[agentIndex]
+
+        if agentIndex == 0:
+            dx, dy = Actions.directionToVector(action, 1)
+            positions[0] = (x + dx, y + dy)
+            if action != Directions.STOP:
+                directions[0] = action
+
+            square = (int(x + dx + 0.5), int(y + dy + 0.5))
+            if manhattanDistance(square, positions[0]) <= 0.5:
+                bit = 1 << (square[0] * self.maze.height + square[1])
+                if self.food & bit:
+                    self.score += 10
+                    self.food ^= bit
+                    self.food_count -= 1
+                    if self.food_count == 0 and not self.lose:
+                        self.score += 500
+                        self.win = True
+                if square in self.capsules:
+                    self.capsules = tuple([capsule for capsule in self.capsules if capsule != square])
+                    scared[1:] = [SCARED_TIME] * (len(scared) - 1)
+            self.score -= TIME_PENALTY
+            for index in range(1, len(positions)):
+                self.collide(index, positions, directions, scared)
+        else:
+            speed = 1.0
+            if scared[agentIndex] > 0:
+                speed /= 2.0
+            dx, dy = Actions.directionToVector(action, speed)
+            positions[agentIndex] = (x + dx, y + dy)
+            if action != Directions.STOP:
+                directions[agentIndex] = action
+
+            timer = scared[agentIndex]
+            if timer == 1:
+                x, y = positions[agentIndex]
+                positions[agentIndex] = (int(x + 0.5), int(y + 0.5))
+            scared[agentIndex] = max(0, timer - 1)
+            self.collide(agentIndex, positions, directions, scared)
+
+        self.positions = tuple(positions)
+        self.directions = tuple(directions)
+        self.scared = tuple(scared)
+
+    def collide(self, index, positions, directions, scared):
+        if manhattanDistance(positions[index], positions[0]) <= COLLISION_TOLERANCE:
+            if scared[index] > 0:
+                self.score += 200
+                positions[index], directions[index] = self.starts[index]
+                scared[index] = 0
+            elif not self.win:
+                self.score -= 500
+                self.lose = True
+
+    def unmake(self):
+        (self.positions, self.directions, self.scared, self.food, self.food_count,
+         self.capsules, self.score, self.win, self.lose) = self.trail.pop()
+
+    def key(self, agentIndex):
+        # the same parts as MultiAgentSearchAgent.state_key
+        return (agentIndex, self.positions, self.directions[1:], self.scared, self.food, self.capsules, self.score)
+
+    def getLegalActions(self, agentIndex=0):
+        if self.win or self.lose:
+            return []
+        x, y = self.positions[agentIndex]
+        square = (int(x + 0.5), int(y + 0.5))
+        direction = self.directions[agentIndex]
+        if abs(x - square[0]) + abs(y - square[1]) > 0.001:
+            # between squares, agents must keep going
+            if agentIndex == 0:
+                return [direction]
+            return ghost_moves([direction], direction)
+        if agentIndex == 0:
+            return self.maze.possible[square]
+        return self.maze.ghost_legal_actions(square, direction)
+
+    def getLegalPacmanActions(self):
+        return self.getLegalActions(0)
+
+    def generateSuccessor(self, agentIndex, action):
+        state = self.copy()
+        state.make(agentIndex, action)
+        state.trail = []
+        return state
+
+    def getNumAgents(self):
+        return len(self.positions)
+
+    def getScore(self):
+        return float(self.score)
+
+    def isWin(self):
+        return self.win
+
+    def isLose(self):
+        return self.lose
+
+    def getPacmanPosition(self):
+        return self.positions[0]
+
+    def getPacmanState(self):
+        return self.getAgentState(0)
+
+    def getGhostPosition(self, agentIndex):
+        return self.positions[agentIndex]
+
+    def getGhostPositions(self):
+        return list(self.positions[1:])
+
+    def getGhostState(self, agentIndex):
+        return self.getAgentState(agentIndex)
+
+    def getGhostStates(self):
+        return [self.getAgentState(index) for index in range(1, len(self.positions))]
+
+    def getAgentState(self, index):
+        agent = AgentState(Configuration(*self.starts[index]), index == 0)
+        agent.configuration = Configuration(self.positions[index], self.directions[index])
+        agent.scaredTimer = self.scared[index]
+        return agent
+
+    def getCapsules(self):
+        return list(self.capsules)
+
+    def getFood(self):
+        return self.maze.food_grid(self.food)
+
+    def getNumFood(self):
+        return self.food_count
+
+    def hasFood(self, x, y):
+        return bool(self.food >> (x * self.maze.height + y) & 1)
+
+    def getWalls(self):
+        return self.maze.walls
+
+    def hasWall(self, x, y):
+        return self.maze.walls[x][y]
+
+
+class SearchTimeout(Exception):
+    """
+      Raised from inside a search when the time budget for the move is used up.
+    """
+    pass
+
+
 class MultiAgentSearchAgent(Agent):
     """
       This class provides some common elements to all of your
@@ -101,11 +467,344 @@ class MultiAgentSearchAgent(Agent):
       is another abstract class.
     """
 
-    def __init__(self, evalFn = 'scoreEvaluationFunction', depth = '2'):
+    def __init__(self, evalFn = 'scoreEvaluationFunction', depth = '2', tableSize = '0',
+                 tableReplacement = 'lru', timeLimit = '0', ordering = '', pvs = '0', samples = '0',
+                 lightState = '0', workers = '0', stats = ''):
         self.index = 0 # Pacman is always agent index 0
         self.evaluationFunction = util.lookup(evalFn, globals())
         self.depth = int(depth)
 
+        # Transposition table, turned on with e.g. -a tableSize=100000. It is
+        # kept between moves, as the same states come up again and again.
+        self.table = None
+        if int(tableSize) > 0:
+            self.table = TranspositionTable(int(tableSize), tableReplacement)
+        self.food_keys = {}
+
+        # Anytime mode, turned on with e.g. -a timeLimit=200 (milliseconds per
+        # move): depth is then ignored, see deepening_search.
+        self.time_limit = float(timeLimit) / 1000
+        self.deadline = None
+        self.cutoff = False
+        self.search_depth = 0
+
+        # Principal variation of the last completed search, ordered by ply
+        # (one ply is one move by one agent)
+        self.pv = []
+        self.pv_line = {}
+        self.on_pv = False
+
+        self.orderings = set([name for name in ordering.split(',') if name])
+        for name in self.orderings:
+            if name not in MOVE_ORDERINGS:
+                raise ValueError('Unknown move ordering: %r' % (name,))
+        self.killers = {}
+        self.history = {}
+
+        # Principal variation search in AlphaBetaAgent, -a pvs=1
+        self.pvs = bool(int(pvs))
+
+        # Sampled chance nodes in ExpectimaxAgent, e.g. -a samples=8
+        self.samples = int(samples)
+        self.rng = random.Random(0)
+
+        # Search on a SearchState with make/unmake, -a lightState=1
+        self.light_state = bool(int(lightState))
+
+        # Parallel root search over a pool of processes, -a workers=4
+        self.workers = int(workers)
+        self.pool = None
+        self.root_values = None
+        self.root_generation = None
+
+        # Nodes visited and cutoffs made at each ply in the last getAction,
+        # summed over the iterations of an anytime search
+        self.ply_nodes = []
+        self.ply_cutoffs = []
+
+        # A SearchRecord for every move, written as JSON lines to the file
+        # given with e.g. -a stats=moves.jsonl, see recorded_search
+        self.instrumentation = Instrumentation(stats) if stats else None
+        self.record = None
+
+    def deepening_search(self, gameState, root_search):
+        """
+          Returns the move picked by root_search(gameState).
+
+          With a time limit, the search is repeated to depth 1, 2, 3, ... until
+          the time is up, and the move from the last search that was completed
+          is returned. The search to depth 1 is always completed, so there is
+          a move to return. The deepening stops early if the last search never
+          reached the depth limit (the game ends inside it), or if there is
+          less time left than the last search took, since a deeper search will
+          take longer.
+        """
+        if self.instrumentation is not None and self.record is None:
+            return self.recorded_search(gameState, root_search)
+        self.food_keys = {}
+        self.pv = []
+        self.ply_nodes = []
+        self.ply_cutoffs = []
+        self.killers = {}
+        if self.workers > 1:
+            root_search = self.parallel_search
+        elif self.light_state:
+            gameState = SearchState(gameState)
+        if not self.time_limit:
+            self.search_depth = self.depth
+            return root_search(gameState)
+
+        depth = self.depth
+        start = time.time()
+        move = None
+        self.depth = 1
+        try:
+            while True:
+                iteration_start = time.time()
+                self.cutoff = False
+                move = root_search(gameState)
+                self.search_depth = self.depth
+                self.pv = self.pv_line.get(0, [])
+                self.deadline = start + self.time_limit
+
+                now = time.time()
+                if self.record is not None:
+                    self.instrumentation.phase(self.record, 'depth %d' % self.depth, now - iteration_start)
+                if not self.cutoff or self.deadline - now < now - iteration_start:
+                    break
+                self.depth += 1
+        except SearchTimeout:
+            if self.record is not None:
+                self.instrumentation.phase(self.record, 'depth %d' % self.depth, time.time() - iteration_start)
+        finally:
+            self.depth = depth
+            self.deadline = None
+        return move
+
+    def recorded_search(self, gameState, root_search):
+        """
+          deepening_search with a SearchRecord for the move. The evaluation
+          function and make_move are wrapped to count evaluations and
+          successors only for the time of the move, and the other counters
+          are read from the search afterwards: nodes and prunings (cutoffs)
+          from ply_nodes and ply_cutoffs, and cache hits from the
+          transposition table. With a pool, only the nodes of the workers
+          are counted, not their evaluations, successors and prunings.
+        """
+        record = self.instrumentation.start('move', agent=self.__class__.__name__, depth=self.depth,
+                                            time_limit=self.time_limit, workers=self.workers)
+        evaluate = self.evaluationFunction
+        self.evaluationFunction = CountingCall(evaluate, record, 'evaluations')
+        self.make_move = CountingCall(self.make_move, record, 'successors')
+        hits = self.table.hits if self.table is not None else 0
+        self.record = record
+        try:
+            move = self.deepening_search(gameState, root_search)
+        finally:
+            self.evaluationFunction = evaluate
+            del self.make_move
+            self.record = None
+
+        record.count('nodes', sum(self.ply_nodes))
+        record.count('prunings', sum(self.ply_cutoffs))
+        if self.table is not None:
+            record.count('cache_hits', self.table.hits - hits)
+        if not self.time_limit:
+            self.instrumentation.phase(record, 'search', time.time() - record.started)
+        self.instrumentation.finish(record, move=move, search_depth=self.search_depth)
+        return move
+
+    # AlphaBetaAgent searches the first root move before the others are
+    # handed out, so they get its value as alpha (Young Brothers Wait)
+    young_brothers_wait = False
+
+    def parallel_search(self, gameState):
+        """
+          Returns the best move from gameState, with the root moves searched
+          by a pool of self.workers processes. Each worker searches a move
+          with root_move_value, and takes as alpha the best value the moves
+          before it have got so far, which is shared through self.root_values.
+          Only earlier moves are used, so a move that ties with a later one
+          is still found, and the moves are searched in the order of
+          root_moves, so the move picked is the same as in the serial search:
+          the first one with the best value.
+        """
+        legal_moves, pv_move = self.root_moves(gameState)
+        pool = self.get_pool()
+        with self.root_values.get_lock():
+            self.root_generation.value += 1
+            generation = self.root_generation.value
+            for i in range(len(self.root_values)):
+                self.root_values[i] = float('-inf')
+
+        a, b = float('-inf'), float('inf')
+        best_move, v = None, float('-inf')
+        first = 0
+        if self.young_brothers_wait:
+            state = SearchState(gameState) if self.light_state else gameState
+            self.on_pv = legal_moves[0] == pv_move
+            best_move, v = legal_moves[0], self.root_move_value(state, legal_moves[0], a, b)
+            a = v
+            self.root_values[0] = v
+            first = 1
+
+        token = (os.getpid(), id(self))
+        tasks = [(token, self, generation, i, gameState, legal_moves[i], a, b, self.depth, self.deadline)
+                 for i in range(first, len(legal_moves))]
+        for index, score, ply_nodes, cutoff in pool.imap(search_root_move, tasks):
+            if score is None:
+                raise SearchTimeout()
+            if cutoff:
+                self.cutoff = True
+            for ply, nodes in enumerate(ply_nodes):
+                self.count_node(ply, nodes)
+            if best_move is None or score > v:
+                best_move, v = legal_moves[index], score
+        if self.time_limit:
+            # only the root move of the line is known, the rest was searched
+            # by the workers
+            self.pv_line[0] = [best_move]
+        return best_move
+
+    def root_moves(self, gameState):
+        """
+          Starts the search of the root, and returns its moves in the order
+          the search tries them, and the move of the principal variation
+          from the last search (or None). Minimax and expectimax keep the
+          engine's order.
+        """
+        self.count_node(0)
+        return gameState.getLegalActions(0), None
+
+    def get_pool(self):
+        if self.pool is None:
+            # one slot for each direction, the most moves Pacman can have
+            self.root_values = multiprocessing.Array('d', 5)
+            self.root_generation = multiprocessing.Value('i', 0)
+            self.pool = multiprocessing.Pool(self.workers, init_root_worker,
+                                             (self.root_values, self.root_generation))
+        return self.pool
+
+    def close_pool(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+
+    def final(self, state):
+        # called by the game when it is over
+        self.close_pool()
+        if self.instrumentation is not None:
+            self.instrumentation.close()
+
+    def __getstate__(self):
+        # What the worker processes get: the settings, but not the pool, and
+        # an empty transposition table of their own
+        state = self.__dict__.copy()
+        state['pool'] = state['root_values'] = state['root_generation'] = None
+        state['instrumentation'] = state['record'] = None
+        state.pop('make_move', None)
+        if isinstance(self.evaluationFunction, CountingCall):
+            state['evaluationFunction'] = self.evaluationFunction.function
+        state['workers'] = 0
+        state['food_keys'] = {}
+        state['pv_line'] = {}
+        if self.table is not None:
+            state['table'] = TranspositionTable(self.table.size, self.table.replacement)
+        return state
+
+    def make_move(self, gameState, agentIndex, move):
+        """
+          Returns the state after the move. A SearchState makes the move in
+          place, and unmake_move must be called with it after the successor
+          has been searched.
+        """
+        if self.light_state:
+            gameState.make(agentIndex, move)
+            return gameState
+        return gameState.generateSuccessor(agentIndex, move)
+
+    def unmake_move(self, gameState):
+        if self.light_state:
+            gameState.unmake()
+
+    def check_time(self):
+        if self.deadline is not None and time.time() > self.deadline:
+            raise SearchTimeout()
+
+    def count_node(self, ply, nodes=1):
+        while len(self.ply_nodes) <= ply:
+            self.ply_nodes.append(0)
+            self.ply_cutoffs.append(0)
+        self.ply_nodes[ply] += nodes
+
+    def ply_stats(self):
+        """
+          Returns a list of (ply, nodes, cutoffs, branching) for the last move,
+          where branching is the number of nodes at the next ply per node at
+          this one (the effective branching factor of the agent to move).
+        """
+        stats = []
+        for ply, nodes in enumerate(self.ply_nodes):
+            branching = None
+            if ply + 1 < len(self.ply_nodes):
+                branching = self.ply_nodes[ply + 1] / float(nodes)
+            stats.append((ply, nodes, self.ply_cutoffs[ply], branching))
+        return stats
+
+    def print_ply_stats(self):
+        print '%4s %10s %8s %9s' % ('ply', 'nodes', 'cutoffs', 'branching')
+        for ply, nodes, cutoffs, branching in self.ply_stats():
+            if branching is None:
+                print '%4d %10d %8d' % (ply, nodes, cutoffs)
+            else:
+                print '%4d %10d %8d %9.2f' % (ply, nodes, cutoffs, branching)
+        print 'nodes: %d, effective branching factor: %.2f' % (sum(self.ply_nodes), self.branching_factor())
+
+    def branching_factor(self):
+        # geometric mean of the branching per ply
+        plies = len(self.ply_nodes) - 1
+        if plies < 1:
+            return 0.0
+        return (self.ply_nodes[-1] / float(self.ply_nodes[0])) ** (1.0 / plies)
+
+    def state_key(self, gameState, agentIndex):
+        """
+          A compact key for the parts of gameState that decide the value of a
+          search from it: the agent to move, the positions and directions of
+          the agents (ghosts can not reverse), the scared timers, the food,
+          the capsules and the score (which the evaluation functions use).
+        """
+        if self.light_state:
+            return gameState.key(agentIndex)
+        ghosts = tuple([(ghost.getPosition(), ghost.getDirection(), ghost.scaredTimer)
+                        for ghost in gameState.getGhostStates()])
+        return (agentIndex, gameState.getPacmanPosition(), ghosts, self.food_key(gameState.getFood()),
+                tuple(gameState.getCapsules()), gameState.getScore())
+
+    def food_key(self, food):
+        cached = self.food_cache(food)
+        if cached[1] is None:
+            cached[1] = food.packBits()
+        return cached[1]
+
+    def food_list(self, food):
+        cached = self.food_cache(food)
+        if cached[2] is None:
+            cached[2] = food.asList()
+        return cached[2]
+
+    def food_cache(self, food):
+        # Successor states share the food grid until Pacman eats something, so
+        # the packed grid and the food positions are cached by object for the
+        # current move. The grid is kept in the cache too, so its id can not be
+        # reused.
+        cached = self.food_keys.get(id(food))
+        if cached is None or cached[0] is not food:
+            cached = [food, None, None]
+            self.food_keys[id(food)] = cached
+        return cached
+
     # def minimax(self, state):
     #     depth = 0
     #
@@ -137,6 +836,53 @@ class MultiAgentSearchAgent(Agent):
 
 
 
+# State of the worker processes of a parallel root search
+_root_values = None
+_root_generation = None
+_root_agents = {}
+
+def init_root_worker(values, generation):
+    global _root_values, _root_generation
+    _root_values = values
+    _root_generation = generation
+
+def search_root_move(task):
+    """
+      Searches one root move in a worker process, for parallel_search.
+      Returns (index, value, nodes per ply, cutoff), where the value is None
+      if the time ran out, and cutoff tells if the search reached the depth
+      limit. The agent is kept, so its transposition table is reused
+      for the following moves of the game.
+    """
+    token, agent, generation, index, gameState, move, a, b, depth, deadline = task
+    agent = _root_agents.setdefault(token, agent)
+    with _root_values.get_lock():
+        if generation == _root_generation.value:
+            a = max([a] + list(_root_values[:index]))
+
+    agent.depth = depth
+    agent.deadline = deadline
+    agent.food_keys = {}
+    agent.ply_nodes = []
+    agent.ply_cutoffs = []
+    agent.killers = {}
+    agent.pv = []
+    agent.cutoff = False
+    if agent.light_state:
+        gameState = SearchState(gameState)
+    try:
+        value = agent.root_move_value(gameState, move, a, b)
+    except SearchTimeout:
+        return index, None, agent.ply_nodes, False
+
+    # only an exact value can be passed on as alpha
+    if value > a:
+        with _root_values.get_lock():
+            if generation == _root_generation.value:
+                _root_values[index] = value
+    return index, value, agent.ply_nodes, agent.cutoff
+
+
 class MinimaxAgent(MultiAgentSearchAgent):
     """
       Your minimax agent (question 2)
@@ -160,38 +906,92 @@ class MinimaxAgent(MultiAgentSearchAgent):
             Returns the total number of agents in the game
         """
         "*** YOUR CODE HERE ***"
-        return self.minimax(gameState)
+        return self.deepening_search(gameState, self.minimax)
 
     def minimax(self, gameState):
         depth = 0
-        legal_moves = gameState.getLegalActions(0)
+        self.count_node(0)
+        best_move, v = None, float('-inf')
+
+        for move in gameState.getLegalActions(0):
+            score = self.min_value(self.make_move(gameState, 0, move), depth, 1)
+            self.unmake_move(gameState)
+            if best_move is None or score > v:
+                best_move, v = move, score
 
-        v = max([(move, self.min_value(gameState.generateSuccessor(0, move), depth, 1)) for move in legal_moves],
-                key=lambda x: x[1])
-        return v[0]
+        return best_move
+
+    def root_move_value(self, gameState, move, a, b):
+        v = self.min_value(self.make_move(gameState, 0, move), 0, 1)
+        self.unmake_move(gameState)
+        return v
 
     def max_value(self, gameState, depth):
+        self.check_time()
+        self.count_node(depth * gameState.getNumAgents())
+        if self.table is not None:
+            key = self.state_key(gameState, 0)
+            entry = self.table.lookup(key)
+            if entry is not None and entry[1] == self.depth - depth:
+                if entry[4]:
+                    self.cutoff = True
+                return entry[0]
+            # self.cutoff is set again if the search below this state reaches
+            # the depth limit, which is stored with its value
+            cutoff, self.cutoff = self.cutoff, False
+
         legal_moves = gameState.getLegalActions(0)
 
         if self.terminal_test(gameState, depth, legal_moves):
-            return self.evaluationFunction(gameState)
-
-        v = max([self.min_value(gameState.generateSuccessor(0, move), depth, 1) for move in legal_moves])
+            v = self.evaluationFunction(gameState)
+        else:
+            v = float('-inf')
+            for move in legal_moves:
+                v = max(v, self.min_value(self.make_move(gameState, 0, move), depth, 1))
+                self.unmake_move(gameState)
+
+        if self.table is not None:
+            self.table.store(key, v, self.depth - depth, EXACT, depth_limited=self.cutoff)
+            self.cutoff = self.cutoff or cutoff
         return v
 
     def min_value(self, gameState, depth, ghostIndex):
+        self.check_time()
+        self.count_node(depth * gameState.getNumAgents() + ghostIndex)
+        if self.table is not None:
+            key = self.state_key(gameState, ghostIndex)
+            entry = self.table.lookup(key)
+            if entry is not None and entry[1] == self.depth - depth:
+                if entry[4]:
+                    self.cutoff = True
+                return entry[0]
+            cutoff, self.cutoff = self.cutoff, False
+
         legal_moves = gameState.getLegalActions(ghostIndex)
 
         if self.terminal_test(gameState, depth, legal_moves):
-            return self.evaluationFunction(gameState)
-
-        if ghostIndex == gameState.getNumAgents()-1:
-            return min([self.max_value(gameState.generateSuccessor(ghostIndex, move), depth + 1) for move in legal_moves])
+            v = self.evaluationFunction(gameState)
         else:
-            return min([self.min_value(gameState.generateSuccessor(ghostIndex, move), depth, ghostIndex + 1) for move in legal_moves])
+            v = float('inf')
+            last_ghost = ghostIndex == gameState.getNumAgents()-1
+            for move in legal_moves:
+                successor = self.make_move(gameState, ghostIndex, move)
+                if last_ghost:
+                    v = min(v, self.max_value(successor, depth + 1))
+                else:
+                    v = min(v, self.min_value(successor, depth, ghostIndex + 1))
+                self.unmake_move(gameState)
+
+        if self.table is not None:
+            self.table.store(key, v, self.depth - depth, EXACT, depth_limited=self.cutoff)
+            self.cutoff = self.cutoff or cutoff
+        return v
 
     def terminal_test(self, gameState, depth, legal_moves):
-        if depth == self.depth or gameState.isWin() or gameState.isLose() or not legal_moves:
+        if gameState.isWin() or gameState.isLose() or not legal_moves:
+            return True
+        if depth == self.depth:
+            self.cutoff = True
             return True
         return False
 
@@ -206,67 +1006,263 @@ class AlphaBetaAgent(MultiAgentSearchAgent):
           Returns the minimax action using self.depth and self.evaluationFunction
         """
         "*** YOUR CODE HERE ***"
-        return self.ab_search(gameState)
+        return self.deepening_search(gameState, self.ab_search)
 
     # --------------------------a-b algorithm----------------------------------
-    def ab_search(self, gameState):
+    def ab_search(self, gameState, a=float('-inf'), b=float('inf')):
         depth = 0
 
-        a = float('-inf')
-        b = float('inf')
+        moves, pv_move = self.root_moves(gameState)
+        best_move, v = None, float('-inf')
 
-        legal_moves = gameState.getLegalActions(0)
-        v_list = []
+        for i, move in enumerate(moves):
+            self.on_pv = move == pv_move
+            score = self.child_value(self.make_move(gameState, 0, move), 1, a, b, depth, i == 0, True)
+            self.unmake_move(gameState)
+            if best_move is None or score > v:
+                best_move, v = move, score
+                self.update_pv(0, move)
 
-        for move in legal_moves:
-            score = self.min_value(gameState.generateSuccessor(0, move), a, b, 1, depth)
-            v_list.append((move, score))
+            if v >= b:
+                break
 
-            a = max(max(v_list, key=lambda x: x[1])[1], a)
+            a = max(a, v)
 
-        return max(v_list, key=lambda x: x[1])[0]
+        return best_move
 
-    def max_value(self, gameState, a, b, depth):
-        legal_moves = gameState.getLegalActions(0)
+    young_brothers_wait = True
 
-        if self.terminal_test(gameState, depth, legal_moves):
-            return self.evaluationFunction(gameState)
+    def root_moves(self, gameState):
+        self.on_pv = True
+        pv_move = self.start_node(0)
+        return self.order_moves(gameState, 0, gameState.getLegalActions(0), 0, pv_move), pv_move
 
-        v = float('-inf')
-        for move in legal_moves:
-            v = max(v, self.min_value(gameState.generateSuccessor(0, move), a, b, 1, depth))
+    def root_move_value(self, gameState, move, a, b):
+        v = self.child_value(self.make_move(gameState, 0, move), 1, a, b, 0, True, True)
+        self.unmake_move(gameState)
+        return v
 
-            if v > b:
-                return v
+    def max_value(self, gameState, a, b, depth):
+        ply = depth * gameState.getNumAgents()
+        pv_move = self.start_node(ply)
+        a_orig, b_orig = a, b
+        if self.table is not None:
+            key = self.state_key(gameState, 0)
+            entry = self.table.lookup(key)
+            if entry is not None and entry[1] == self.depth - depth:
+                value, bound = entry[0], entry[2]
+                if bound == EXACT or (bound == LOWER and value >= b) or (bound == UPPER and value <= a):
+                    if entry[4]:
+                        self.cutoff = True
+                    return value
+                # the stored bound narrows the window
+                if bound == LOWER:
+                    a = max(a, value)
+                else:
+                    b = min(b, value)
+            cutoff, self.cutoff = self.cutoff, False
 
-            a = max(a, v)
+        legal_moves = gameState.getLegalActions(0)
 
+        if self.terminal_test(gameState, depth, legal_moves):
+            v = self.evaluationFunction(gameState)
+        else:
+            v = float('-inf')
+            for i, move in enumerate(self.order_moves(gameState, 0, legal_moves, ply, pv_move)):
+                self.on_pv = move == pv_move
+                score = self.child_value(self.make_move(gameState, 0, move), 1, a, b, depth, i == 0, True)
+                self.unmake_move(gameState)
+                if score > v:
+                    v = score
+                    self.update_pv(ply, move)
+
+                if v >= b:
+                    self.cut(gameState, 0, move, ply, depth)
+                    break
+
+                a = max(a, v)
+
+        if self.table is not None:
+            self.table.store(key, v, self.depth - depth, self.bound(v, a_orig, b_orig),
+                             depth_limited=self.cutoff)
+            self.cutoff = self.cutoff or cutoff
         return v
 
     def min_value(self, gameState, a, b, ghostIndex, depth):
+        ply = depth * gameState.getNumAgents() + ghostIndex
+        pv_move = self.start_node(ply)
+        a_orig, b_orig = a, b
+        if self.table is not None:
+            key = self.state_key(gameState, ghostIndex)
+            entry = self.table.lookup(key)
+            if entry is not None and entry[1] == self.depth - depth:
+                value, bound = entry[0], entry[2]
+                if bound == EXACT or (bound == LOWER and value >= b) or (bound == UPPER and value <= a):
+                    if entry[4]:
+                        self.cutoff = True
+                    return value
+                if bound == LOWER:
+                    a = max(a, value)
+                else:
+                    b = min(b, value)
+            cutoff, self.cutoff = self.cutoff, False
+
         legal_moves = gameState.getLegalActions(ghostIndex)
 
         if self.terminal_test(gameState, depth, legal_moves):
-            return self.evaluationFunction(gameState)
-
-        v = float('inf')
-        for move in legal_moves:
-            successor = gameState.generateSuccessor(ghostIndex, move)
-
-            if ghostIndex == gameState.getNumAgents()-1:
-                v = min(v, self.max_value(successor, a, b, depth+1))
-            else:
-                v = min(v, self.min_value(successor, a, b, ghostIndex+1, depth))
+            v = self.evaluationFunction(gameState)
+        else:
+            v = float('inf')
+            for i, move in enumerate(self.order_moves(gameState, ghostIndex, legal_moves, ply, pv_move)):
+                self.on_pv = move == pv_move
+                successor = self.make_move(gameState, ghostIndex, move)
+                score = self.child_value(successor, ghostIndex + 1, a, b, depth, i == 0, False)
+                self.unmake_move(gameState)
+                if score < v:
+                    v = score
+                    self.update_pv(ply, move)
+
+                if v <= a:
+                    self.cut(gameState, ghostIndex, move, ply, depth)
+                    break
+
+                b = min(b, v)
+
+        if self.table is not None:
+            self.table.store(key, v, self.depth - depth, self.bound(v, a_orig, b_orig),
+                             depth_limited=self.cutoff)
+            self.cutoff = self.cutoff or cutoff
+        return v
 
-            if v < a:
-                return v
+    def child_value(self, successor, agentIndex, a, b, depth, first, maximizing):
+        """
+          Returns the value of successor, where agentIndex is the next agent to
+          move (Pacman again after the last ghost).
+
+          With principal variation search, only the first move of a node is
+          searched with the full window. The others are searched with a null
+          window next to the value they have to beat, which only shows whether
+          they are better, and are searched again with the full window if so.
+          The value to beat is a for Pacman and b for a ghost, and while it is
+          still infinite there is no null window next to it.
+        """
+        bound = a if maximizing else -b
+        if not self.pvs or first or bound == float('-inf'):
+            return self.value(successor, agentIndex, a, b, depth)
+
+        if maximizing:
+            score = self.value(successor, agentIndex, a, a + NULL_WINDOW, depth)
+            if a < score < b:
+                score = self.value(successor, agentIndex, score, b, depth)
+        else:
+            score = self.value(successor, agentIndex, b - NULL_WINDOW, b, depth)
+            if a < score < b:
+                score = self.value(successor, agentIndex, a, score, depth)
+        return score
 
-            b = min(b, v)
+    def value(self, gameState, agentIndex, a, b, depth):
+        if agentIndex == gameState.getNumAgents():
+            return self.max_value(gameState, a, b, depth + 1)
+        return self.min_value(gameState, a, b, agentIndex, depth)
 
-        return v
+    def start_node(self, ply):
+        """
+          Checks the clock at the start of a node, and returns the move that
+          the principal variation from the last search made here if the node
+          is on it, so it can be searched first (or None).
+        """
+        self.check_time()
+        self.count_node(ply)
+        if not self.time_limit:
+            return None
+        self.pv_line[ply] = []
+        if not self.on_pv:
+            return None
+        self.on_pv = False
+        if ply < len(self.pv):
+            return self.pv[ply]
+        return None
+
+    def order_moves(self, gameState, agentIndex, legal_moves, ply, pv_move):
+        """
+          Returns the moves in the order to search them: the move of the
+          principal variation, then the killer moves of the ply, then the rest
+          by history score, and static order for moves with the same score.
+          With no orderings turned on, the engine's order is kept.
+        """
+        moves = legal_moves
+        if 'static' in self.orderings:
+            moves = self.static_order(gameState, agentIndex, moves)
+        if 'history' in self.orderings:
+            position = self.agent_position(gameState, agentIndex)
+            moves = sorted(moves, key=lambda move: -self.history.get((agentIndex, position, move), 0))
+
+        first = []
+        if pv_move is not None and pv_move in legal_moves:
+            first.append(pv_move)
+        if 'killers' in self.orderings:
+            for move in self.killers.get(ply, ()):
+                if move in legal_moves and move not in first:
+                    first.append(move)
+        if not first:
+            return moves
+        return first + [move for move in moves if move not in first]
+
+    def static_order(self, gameState, agentIndex, legal_moves):
+        # Pacman: moves away from non-scared ghosts first, then towards food.
+        # Ghosts: moves towards Pacman first.
+        position = self.agent_position(gameState, agentIndex)
+        if agentIndex != 0:
+            pacman = gameState.getPacmanPosition()
+            return sorted(legal_moves, key=lambda move: manhattanDistance(Actions.getSuccessor(position, move), pacman))
+
+        ghosts = [ghost.getPosition() for ghost in gameState.getGhostStates() if ghost.scaredTimer == 0]
+        food = self.food_list(gameState.getFood())
+
+        def key(move):
+            successor = Actions.getSuccessor(position, move)
+            danger = min([manhattanDistance(successor, ghost) for ghost in ghosts] + [2]) < 2
+            closest = min([manhattanDistance(successor, dot) for dot in food]) if food else 0
+            return (danger, closest)
+
+        return sorted(legal_moves, key=key)
+
+    def agent_position(self, gameState, agentIndex):
+        if agentIndex == 0:
+            return gameState.getPacmanPosition()
+        return gameState.getGhostPosition(agentIndex)
+
+    def cut(self, gameState, agentIndex, move, ply, depth):
+        # move caused a cutoff: remember it as a killer for the ply, and give
+        # it a history bonus that grows with the depth of the search below it
+        self.ply_cutoffs[ply] += 1
+        if 'killers' in self.orderings:
+            killers = self.killers.setdefault(ply, [])
+            if move not in killers:
+                killers.insert(0, move)
+                del killers[2:]
+        if 'history' in self.orderings:
+            key = (agentIndex, self.agent_position(gameState, agentIndex), move)
+            self.history[key] = self.history.get(key, 0) + (self.depth - depth) ** 2
+
+    def update_pv(self, ply, move):
+        # the best line from this node is the move and the best line after it
+        if self.time_limit:
+            self.pv_line[ply] = [move] + self.pv_line.get(ply + 1, [])
+
+    def bound(self, v, a, b):
+        # what v tells about the value of a node searched with the window (a, b)
+        if v >= b:
+            return LOWER
+        if v <= a:
+            return UPPER
+        return EXACT
 
     def terminal_test(self, gameState, depth, legal_moves):
-        if depth == self.depth or gameState.isWin() or gameState.isLose() or not legal_moves:
+        if gameState.isWin() or gameState.isLose() or not legal_moves:
+            return True
+        if depth == self.depth:
+            self.cutoff = True
             return True
         return False
 
@@ -284,18 +1280,346 @@ class ExpectimaxAgent(MultiAgentSearchAgent):
           legal moves.
         """
         "*** YOUR CODE HERE ***"
-        util.raiseNotDefined()
+        return self.deepening_search(gameState, self.expectimax)
+
+    def expectimax(self, gameState):
+        depth = 0
+        self.count_node(0)
+        best_move, v = None, float('-inf')
+
+        for move in gameState.getLegalActions(0):
+            score = self.chance_value(self.make_move(gameState, 0, move), depth, 1)
+            self.unmake_move(gameState)
+            if best_move is None or score > v:
+                best_move, v = move, score
+
+        return best_move
+
+    def root_move_value(self, gameState, move, a, b):
+        v = self.chance_value(self.make_move(gameState, 0, move), 0, 1)
+        self.unmake_move(gameState)
+        return v
+
+    def max_value(self, gameState, depth):
+        self.check_time()
+        self.count_node(depth * gameState.getNumAgents())
+        if self.table is not None:
+            key = self.state_key(gameState, 0)
+            entry = self.table.lookup(key)
+            if entry is not None and entry[1] == self.depth - depth:
+                if entry[4]:
+                    self.cutoff = True
+                return entry[0]
+            cutoff, self.cutoff = self.cutoff, False
+
+        legal_moves = gameState.getLegalActions(0)
+
+        if self.terminal_test(gameState, depth, legal_moves):
+            v = self.evaluationFunction(gameState)
+        else:
+            v = float('-inf')
+            for move in legal_moves:
+                v = max(v, self.chance_value(self.make_move(gameState, 0, move), depth, 1))
+                self.unmake_move(gameState)
+
+        if self.table is not None:
+            self.table.store(key, v, self.depth - depth, EXACT, depth_limited=self.cutoff)
+            self.cutoff = self.cutoff or cutoff
+        return v
+
+    def chance_value(self, gameState, depth, ghostIndex):
+        self.check_time()
+        self.count_node(depth * gameState.getNumAgents() + ghostIndex)
+        if self.table is not None:
+            key = self.state_key(gameState, ghostIndex)
+            entry = self.table.lookup(key)
+            if entry is not None and entry[1] == self.depth - depth:
+                if entry[4]:
+                    self.cutoff = True
+                return entry[0]
+            cutoff, self.cutoff = self.cutoff, False
+
+        legal_moves = gameState.getLegalActions(ghostIndex)
+
+        if self.terminal_test(gameState, depth, legal_moves):
+            v = self.evaluationFunction(gameState)
+        elif ghostIndex == 1 and self.samples and self.outcomes(gameState) > self.samples:
+            v = self.sampled_value(gameState, depth)
+        else:
+            total = 0.0
+            last_ghost = ghostIndex == gameState.getNumAgents()-1
+            for move in legal_moves:
+                successor = self.make_move(gameState, ghostIndex, move)
+                if last_ghost:
+                    total += self.max_value(successor, depth + 1)
+                else:
+                    total += self.chance_value(successor, depth, ghostIndex + 1)
+                self.unmake_move(gameState)
+            v = total / len(legal_moves)
+
+        if self.table is not None:
+            self.table.store(key, v, self.depth - depth, EXACT, depth_limited=self.cutoff)
+            self.cutoff = self.cutoff or cutoff
+        return v
+
+    def outcomes(self, gameState):
+        # The number of ways the ghosts can move in a round. A ghost's legal
+        # moves only depend on its own position and direction, so the count
+        # can be taken before any ghost has moved.
+        count = 1
+        for ghostIndex in range(1, gameState.getNumAgents()):
+            count *= max(len(gameState.getLegalActions(ghostIndex)), 1)
+        return count
+
+    def sampled_value(self, gameState, depth):
+        """
+          Estimates the value of a round of ghost moves from the average of
+          self.samples rounds where every ghost picks a random legal move. The
+          search then grows by self.samples states per round instead of by
+          the product of the ghosts' moves, at the cost of an exact value.
+          Used when there are more outcomes than samples.
+        """
+        total = 0.0
+        for i in range(self.samples):
+            successor = gameState
+            moves = 0
+            for ghostIndex in range(1, gameState.getNumAgents()):
+                if successor.isWin() or successor.isLose():
+                    break
+                legal_moves = successor.getLegalActions(ghostIndex)
+                if legal_moves:
+                    successor = self.make_move(successor, ghostIndex, self.rng.choice(legal_moves))
+                    moves += 1
+            total += self.max_value(successor, depth + 1)
+            for move in range(moves):
+                self.unmake_move(gameState)
+        return total / self.samples
+
+    def terminal_test(self, gameState, depth, legal_moves):
+        if gameState.isWin() or gameState.isLose() or not legal_moves:
+            return True
+        if depth == self.depth:
+            self.cutoff = True
+            return True
+        return False
+
+class MazeDistances:
+    """
+      The shortest path distances between all pairs of open squares of a
+      maze, found by a breadth first search from every square.
+
+      With numpy the distances are kept in an array, with a row for each
+      square, so the distances from one square to many (all the food, all
+      the ghosts) are looked up in one indexing operation. Without numpy
+      the rows are lists, and the same methods work on them.
+    """
+
+    def __init__(self, walls):
+        self.walls = walls
+        self.cells = [(x, y) for x in range(walls.width) for y in range(walls.height) if not walls[x][y]]
+        self.index = dict([(cell, i) for i, cell in enumerate(self.cells)])
+
+        # squares that can not be reached count as this far away
+        self.unreachable = walls.width * walls.height
+        neighbors = [[self.index[neighbor] for neighbor in Actions.getLegalNeighbors(cell, walls)
+                      if neighbor != cell] for cell in self.cells]
+        rows = [self.search(start, neighbors) for start in range(len(self.cells))]
+
+        if numpy is not None:
+            self.distances = numpy.array(rows, dtype=numpy.int32)
+            self.grid_index = numpy.full((walls.width, walls.height), -1, dtype=numpy.int32)
+            for i, (x, y) in enumerate(self.cells):
+                self.grid_index[x, y] = i
+        else:
+            self.distances = rows
+
+    def search(self, start, neighbors):
+        distances = [self.unreachable] * len(self.cells)
+        distances[start] = 0
+        queue = deque([start])
+        while queue:
+            cell = queue.popleft()
+            for neighbor in neighbors[cell]:
+                if distances[neighbor] == self.unreachable:
+                    distances[neighbor] = distances[cell] + 1
+                    queue.append(neighbor)
+        return distances
+
+    def cell_of(self, position):
+        # agents can be halfway between squares (scared ghosts are slow)
+        x, y = position
+        return self.index[(int(x + 0.5), int(y + 0.5))]
+
+    def distance(self, a, b):
+        return self.distances[self.cell_of(a)][self.cell_of(b)]
+
+    def distances_from(self, position):
+        return self.distances[self.cell_of(position)]
+
+    def cells_of(self, grid):
+        """
+          The indices of the squares that are True in grid (e.g. the food).
+        """
+        if numpy is not None:
+            return self.grid_index[numpy.array(grid.data, dtype=bool)]
+        return [self.index[cell] for cell in grid.asList()]
+
+
+_maze_distances = {}
+_food_cells = {}
+
+def get_maze_distances(walls):
+    """
+      Get the MazeDistances of the maze with the given walls, finding them
+      the first time they are needed. All the states of a game share the
+      walls of the layout, so they are looked up by the walls object (which
+      the cache keeps, so its id is not reused).
+    """
+    cached = _maze_distances.get(id(walls))
+    if cached is None or cached[0] is not walls:
+        cached = (walls, MazeDistances(walls))
+        _maze_distances[id(walls)] = cached
+    return cached[1]
+
+def get_food_cells(maze, food):
+    # The food grid is shared by states until Pacman eats, so the squares
+    # with food are cached by grid object. The cache is emptied now and
+    # then, as grids of states that are gone pile up in it.
+    cached = _food_cells.get(id(food))
+    if cached is None or cached[0] is not food or cached[1] is not maze:
+        if len(_food_cells) > 10000:
+            _food_cells.clear()
+        cached = (food, maze, maze.cells_of(food))
+        _food_cells[id(food)] = cached
+    return cached[2]
 
 def betterEvaluationFunction(currentGameState):
     """
       Your extreme ghost-hunting, pellet-nabbing, food-gobbling, unstoppable
       evaluation function (question 5).
 
-      DESCRIPTION: <write something here so we know what you did>
+      DESCRIPTION: The score of the state, adjusted by
+        - the food left (fewer is better) and the maze distance to the
+          closest food (closer is better)
+        - the capsules left (fewer is better)
+        - ghosts that are not scared: a large penalty next to one, and a
+          small one that falls off with the distance to the others
+        - scared ghosts Pacman can reach before they recover: a bonus that
+          grows as they get closer
+      Maze distances come from a MazeDistances table built once per layout,
+      so the features are array lookups over the food and the ghosts.
     """
     "*** YOUR CODE HERE ***"
-    util.raiseNotDefined()
+    if currentGameState.isWin() or currentGameState.isLose():
+        return currentGameState.getScore()
+
+    maze = get_maze_distances(currentGameState.getWalls())
+    distances = maze.distances_from(currentGameState.getPacmanPosition())
+    food = get_food_cells(maze, currentGameState.getFood())
+    ghosts = [maze.cell_of(ghost.getPosition()) for ghost in currentGameState.getGhostStates()]
+    timers = [ghost.scaredTimer for ghost in currentGameState.getGhostStates()]
+
+    if numpy is not None:
+        food_count = len(food)
+        closest_food = distances[food].min() if food_count else 0
+        ghost_distances = distances[ghosts]
+        timers = numpy.array(timers)
+        active = ghost_distances[timers == 0]
+        scared = ghost_distances[(timers > 0) & (ghost_distances < timers)]
+        threat = 500 * numpy.count_nonzero(active <= 1) + (2.0 / (active + 1)).sum()
+        chase = (100.0 / (scared + 1)).sum()
+    else:
+        food_count = len(food)
+        closest_food = min([distances[cell] for cell in food]) if food_count else 0
+        ghost_distances = [distances[cell] for cell in ghosts]
+        active = [d for d, timer in zip(ghost_distances, timers) if timer == 0]
+        scared = [d for d, timer in zip(ghost_distances, timers) if 0 < timer and d < timer]
+        threat = 500 * len([d for d in active if d <= 1]) + sum([2.0 / (d + 1) for d in active])
+        chase = sum([100.0 / (d + 1) for d in scared])
+
+    return float(currentGameState.getScore() - 4 * food_count - 1.5 * closest_food
+                 - 20 * len(currentGameState.getCapsules()) - threat + chase)
 
 # Abbreviation
 better = betterEvaluationFunction
 
+
+def sample_states(layoutName, count, seed=0):
+    """
+      Returns count game states of the layout, the first being the start
+      state and the rest reached by random moves of all the agents from it.
+      Needs the layout and pacman modules of the Pacman project.
+    """
+    import layout, pacman
+    rng = random.Random(seed)
+    gameState = pacman.GameState()
+    gameState.initialize(layout.getLayout(layoutName), 1000)
+
+    states = []
+    while len(states) < count and not (gameState.isWin() or gameState.isLose()):
+        states.append(gameState)
+        for agentIndex in range(gameState.getNumAgents()):
+            if gameState.isWin() or gameState.isLose():
+                break
+            gameState = gameState.generateSuccessor(agentIndex, rng.choice(gameState.getLegalActions(agentIndex)))
+    return states
+
+def benchmark_alpha_beta(layouts=('minimaxClassic', 'testClassic', 'smallClassic'), depths=(2, 3, 4), count=3, seed=0):
+    """
+      Counts the nodes MinimaxAgent, AlphaBetaAgent and AlphaBetaAgent with
+      principal variation search visit from the same states, and checks that
+      they all pick the same moves.
+    """
+    print '%-16s %5s %10s %10s %10s %7s %6s' % ('layout', 'depth', 'minimax', 'alphabeta', 'pvs', 'saved', 'same')
+    for layoutName in layouts:
+        states = sample_states(layoutName, count, seed)
+        for depth in depths:
+            agents = [MinimaxAgent(depth=str(depth)), AlphaBetaAgent(depth=str(depth)),
+                      AlphaBetaAgent(depth=str(depth), pvs='1')]
+            nodes = [0] * len(agents)
+            same = 0
+            for gameState in states:
+                moves = []
+                for i, agent in enumerate(agents):
+                    moves.append(agent.getAction(gameState))
+                    nodes[i] += sum(agent.ply_nodes)
+                same += len(set(moves)) == 1
+            saved = 1 - min(nodes[1:]) / float(nodes[0])
+            print '%-16s %5d %10d %10d %10d %6.1f%% %3d/%d' % (layoutName, depth, nodes[0], nodes[1], nodes[2],
+                                                               100 * saved, same, len(states))
+
+def benchmark_parallel(layoutName='smallClassic', depth=4, workers=(1, 2, 4, 8), count=3, seed=0,
+                       orderings=('', 'static,killers')):
+    """
+      Times MinimaxAgent and AlphaBetaAgent with the root moves split over
+      different numbers of worker processes, from the same states, and
+      checks that they pick the same moves as the serial search, with each
+      of the move orderings.
+    """
+    states = sample_states(layoutName, count, seed)
+    print '%-15s %-15s %7s %9s %8s %6s' % ('agent', 'ordering', 'workers', 'seconds', 'speedup', 'same')
+    for agentType in (MinimaxAgent, AlphaBetaAgent):
+        # minimax searches every move, in the engine's order
+        for ordering in (orderings if agentType is AlphaBetaAgent else ('',)):
+            serial_moves = None
+            for n in workers:
+                agent = agentType(depth=str(depth), workers=str(n), ordering=ordering)
+                if n > 1:
+                    agent.get_pool()
+                start = time.time()
+                moves = [agent.getAction(gameState) for gameState in states]
+                seconds = time.time() - start
+                agent.close_pool()
+
+                if serial_moves is None:
+                    serial_moves, serial_seconds = moves, seconds
+                same = len([1 for move, serial_move in zip(moves, serial_moves) if move == serial_move])
+                print '%-15s %-15s %7d %9.2f %7.2fx %3d/%d' % (agentType.__name__, ordering or '-', n, seconds,
+                                                              serial_seconds / seconds, same, len(states))
+
+if __name__ == '__main__':
+    import sys
+    if sys.argv[1:] == ['parallel']:
+        benchmark_parallel()
+    else:
+        benchmark_alpha_beta()
@@ -1,8 +1,672 @@
 #!/usr/bin/python
 # -*- coding: UTF-8 -*-
 
-import copy
+import argparse
+import functools
 import itertools
+import math
+import multiprocessing
+import random
+import sys
+import time
+from array import array
+from collections import OrderedDict, deque
+
+# The support set of a value that has no legal partner
+NO_SUPPORT = frozenset()
+
+class SupportTable:
+    """The legal value pairs of one arc (i, j), indexed by the value of
+    variable 'i'. self.supports[x] is the set of values of 'j' that are
+    compatible with the value 'x' of 'i', so checking a pair or finding
+    the supports of a value is a hash lookup instead of a list scan.
+
+    The table still behaves like the old list of legal value pairs:
+    '(x, y) in table', iterating over the pairs and len() all work.
+    """
+
+    def __init__(self, pairs=()):
+        self.supports = {}
+        for x, y in pairs:
+            self.supports.setdefault(x, set()).add(y)
+
+    def __contains__(self, value_pair):
+        x, y = value_pair
+        return x in self.supports and y in self.supports[x]
+
+    def __iter__(self):
+        for x, ys in self.supports.items():
+            for y in ys:
+                yield (x, y)
+
+    def __len__(self):
+        return sum(len(ys) for ys in self.supports.values())
+
+    def get(self, x):
+        """Get the set of values of 'j' supporting the value 'x' of 'i'."""
+        return self.supports.get(x, NO_SUPPORT)
+
+
+class PredicateTable:
+    """The intensional version of SupportTable: instead of the legal value
+    pairs, the predicate 'predicate(x, y)' is stored and evaluated only
+    for the pairs the search actually checks. The results are memoised
+    in a cache of at most 'cache_size' pairs, and an arbitrary entry is
+    evicted when it is full, so the memory used by a constraint does not
+    grow with the product of the domains.
+
+    It has the same interface as SupportTable. get(x) gives a set-like
+    object that evaluates the predicate on '(y in supports)', and
+    iterating over the pairs or taking len() goes through the whole
+    product of 'domain_i' and 'domain_j'.
+    """
+
+    def __init__(self, predicate, domain_i, domain_j, cache_size=100000):
+        self.predicate = predicate
+        self.domain_i = domain_i
+        self.domain_j = domain_j
+        self.cache_size = cache_size
+        self.cache = {}
+        self.hits = 0
+        self.misses = 0
+
+    def check(self, x, y):
+        """Check if the pair (x, y) is legal."""
+        key = (x, y)
+        cache = self.cache
+        legal = cache.get(key)
+        if legal is not None:
+            self.hits += 1
+            return legal
+        self.misses += 1
+        legal = bool(self.predicate(x, y))
+        if self.cache_size > 0:
+            if len(cache) >= self.cache_size:
+                cache.popitem()
+            cache[key] = legal
+        return legal
+
+    def __contains__(self, value_pair):
+        return self.check(*value_pair)
+
+    def __iter__(self):
+        for x in self.domain_i:
+            for y in self.domain_j:
+                if self.check(x, y):
+                    yield (x, y)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def get(self, x):
+        """Get the values of 'j' supporting the value 'x' of 'i', as an
+        object that only supports 'in'.
+        """
+        return PredicateSupports(self, x)
+
+
+class PredicateSupports:
+    """The support set of the value 'x' in a PredicateTable."""
+
+    def __init__(self, table, x):
+        self.table = table
+        self.x = x
+
+    def __contains__(self, y):
+        return self.table.check(self.x, y)
+
+
+class Domains(dict):
+    """The current domains of the CSP variables during the search, as a
+    dictionary mapping each variable name to its list of legal values.
+
+    Every value removed through remove() or assign() is recorded on a
+    trail, so that undo() can put the domains back exactly as they were
+    at an earlier mark(). Backtracking then costs O(changes) instead of a
+    deep copy of every domain.
+
+    If self.watch is set, it is called with the variable every time a
+    domain changes, so that a heuristic can keep its own structures up
+    to date.
+    """
+
+    compact = False
+
+    def __init__(self, domains):
+        dict.__init__(self, ((var, list(values)) for var, values in domains.items()))
+        self.trail = []
+        self.watch = None
+
+    def size(self, var):
+        """Get the number of legal values left for 'var'."""
+        return len(self[var])
+
+    def values_of(self, var):
+        """Get the list of legal values left for 'var'."""
+        return self[var]
+
+    def contains(self, var, value):
+        """Check if 'value' is still a legal value for 'var'."""
+        return value in self[var]
+
+    def solution(self):
+        """Get the domains as a plain dictionary of value lists."""
+        return dict((var, list(values)) for var, values in self.items())
+
+    def mark(self):
+        """Get a marker for the current state of the domains, that can
+        later be passed to undo().
+        """
+        return len(self.trail)
+
+    def remove(self, var, value):
+        """Remove 'value' from the domain of 'var'."""
+        values = self[var]
+        index = values.index(value)
+        del values[index]
+        self.trail.append((var, index, value))
+        if self.watch is not None:
+            self.watch(var)
+
+    def assign(self, var, value):
+        """Reduce the domain of 'var' to the single value 'value'."""
+        values = self[var]
+        for index in range(len(values) - 1, -1, -1):
+            if values[index] != value:
+                self.trail.append((var, index, values[index]))
+                del values[index]
+        if self.watch is not None:
+            self.watch(var)
+
+    def undo(self, mark):
+        """Put back every value removed since 'mark', in reverse order,
+        so that each domain gets its original order back.
+        """
+        trail = self.trail
+        while len(trail) > mark:
+            var, index, value = trail.pop()
+            self[var].insert(index, value)
+            if self.watch is not None:
+                self.watch(var)
+
+
+class BitDomains(dict):
+    """The compact version of Domains, for CSPs with at most 64 distinct
+    values. Every value is interned to a bit position, and the domain of
+    each variable is an integer bitmask of its legal values. Removing
+    values is a single '&' and the trail only stores the old masks.
+    """
+
+    compact = True
+
+    def __init__(self, domains, value_bits, bit_values):
+        dict.__init__(self, ((var, sum(value_bits[value] for value in set(values)))
+                             for var, values in domains.items()))
+        self.value_bits = value_bits
+        self.bit_values = bit_values
+        self.trail = []
+        self.watch = None
+
+    def size(self, var):
+        """Get the number of legal values left for 'var'."""
+        return bin(self[var]).count('1')
+
+    def values_of(self, var):
+        """Get the list of legal values left for 'var', in bit order."""
+        values = []
+        mask = self[var]
+        while mask:
+            bit = mask & -mask
+            values.append(self.bit_values[bit])
+            mask ^= bit
+        return values
+
+    def contains(self, var, value):
+        """Check if 'value' is still a legal value for 'var'."""
+        return self[var] & self.value_bits[value] != 0
+
+    def solution(self):
+        """Decode the bitmasks into a plain dictionary of value lists."""
+        return dict((var, self.values_of(var)) for var in self)
+
+    def mark(self):
+        """Get a marker for the current state of the domains, that can
+        later be passed to undo().
+        """
+        return len(self.trail)
+
+    def remove(self, var, value):
+        """Remove 'value' from the domain of 'var'."""
+        self.remove_bits(var, self.value_bits[value])
+
+    def remove_bits(self, var, bits):
+        """Remove all of the values in the bitmask 'bits' from the
+        domain of 'var'.
+        """
+        self.trail.append((var, self[var]))
+        self[var] &= ~bits
+        if self.watch is not None:
+            self.watch(var)
+
+    def assign(self, var, value):
+        """Reduce the domain of 'var' to the single value 'value'."""
+        self.trail.append((var, self[var]))
+        self[var] = self.value_bits[value]
+        if self.watch is not None:
+            self.watch(var)
+
+    def undo(self, mark):
+        """Put back every domain changed since 'mark'."""
+        trail = self.trail
+        while len(trail) > mark:
+            var, mask = trail.pop()
+            self[var] = mask
+            if self.watch is not None:
+                self.watch(var)
+
+
+class MinimumRemainingValues:
+    """Variable ordering heuristic that picks the undecided variable with
+    the fewest legal values left. Ties are broken like in the original
+    solver, see CSP.tie_ranks(), so that the backtrack counts stay the
+    same.
+
+    Instead of looking at every variable on every call, the undecided
+    variables are kept in buckets by domain size, which are updated
+    through the watch hook of the domains whenever a domain changes.
+    """
+
+    def start(self, csp, assignment):
+        """Prepare the heuristic for a new search over 'assignment'."""
+        self.csp = csp
+        self.assignment = assignment
+        self.sizes = {}
+        self.buckets = {}
+        for var in csp.variables:
+            self.changed(var)
+        assignment.watch = self.changed
+
+    def tie_key(self, var, ranks):
+        return ranks[self.csp.var_ids[var]]
+
+    def changed(self, var):
+        size = self.assignment.size(var)
+        old = self.sizes.get(var)
+        if old == size:
+            return
+        if old is not None and old > 1:
+            self.buckets[old].discard(var)
+        self.sizes[var] = size
+        if size > 1:
+            if size not in self.buckets:
+                self.buckets[size] = set()
+            self.buckets[size].add(var)
+
+    def select(self, csp, assignment):
+        """Get the next variable to assign a value to."""
+        best = None
+        for size, bucket in self.buckets.items():
+            if bucket and (best is None or size < best):
+                best = size
+        if best is None:
+            return None
+        ranks = csp.tie_ranks(csp.level)
+        return min(self.buckets[best], key=lambda var: self.tie_key(var, ranks))
+
+
+class MinimumRemainingValuesDegree(MinimumRemainingValues):
+    """MRV with the degree heuristic as tie-break: among the variables
+    with the fewest legal values, the one involved in the most
+    constraints is picked first. The degree is counted once per search,
+    over both the binary and the native Alldiff constraints.
+    """
+
+    def start(self, csp, assignment):
+        degree = {}
+        for var in csp.variables:
+            others = set(csp.neighbors[var])
+            for k in csp.all_different_of[var]:
+                others.update(csp.all_different[k])
+            others.discard(var)
+            degree[var] = len(others)
+        self.degree = degree
+        MinimumRemainingValues.start(self, csp, assignment)
+
+    def tie_key(self, var, ranks):
+        return (-self.degree[var], ranks[self.csp.var_ids[var]])
+
+
+class DomainOverWeightedDegree:
+    """The dom/wdeg variable ordering heuristic. Every constraint has a
+    weight, starting at 1, that inference() bumps every time the
+    constraint wipes out a domain (see CSP.constraint_weights). The
+    variable with the smallest ratio between its domain size and the
+    summed weights of its constraints to other undecided variables is
+    picked, so the search focuses on the hard parts of the problem.
+    """
+
+    def start(self, csp, assignment):
+        """Prepare the heuristic for a new search over 'assignment'."""
+        pass
+
+    def select(self, csp, assignment):
+        """Get the next variable to assign a value to."""
+        weights = csp.constraint_weights
+        best = None
+        best_score = None
+        for var in csp.variables:
+            size = assignment.size(var)
+            if size <= 1:
+                continue
+            wdeg = 0
+            for other in csp.neighbors[var]:
+                if assignment.size(other) > 1:
+                    wdeg += weights.get(frozenset((var, other)), 1)
+            for k in csp.all_different_of[var]:
+                wdeg += weights.get(k, 1)
+            score = size / float(max(wdeg, 1))
+            if best is None or score < best_score:
+                best = var
+                best_score = score
+        return best
+
+
+class DomainOrder:
+    """Value ordering heuristic that tries the values in the order they
+    have in the domain.
+    """
+
+    def order(self, csp, assignment, var):
+        """Get the list of values of 'var', in the order to try them."""
+        return list(assignment.values_of(var))
+
+
+class LeastConstrainingValue:
+    """The least-constraining-value ordering heuristic: the values of
+    'var' are tried in increasing order of how many values they would
+    remove from the domains of the undecided neighbours, through both
+    binary and native Alldiff constraints.
+    """
+
+    def order(self, csp, assignment, var):
+        """Get the list of values of 'var', in the order to try them."""
+        values = list(assignment.values_of(var))
+        if len(values) <= 1:
+            return values
+
+        ruled_out = {}
+        for value in values:
+            count = 0
+            if assignment.compact:
+                bit = assignment.value_bits[value]
+                for other in csp.neighbors[var]:
+                    if assignment.size(other) > 1:
+                        supported = csp.bit_constraints[var][other].get(bit, 0)
+                        count += bin(assignment[other] & ~supported).count('1')
+            else:
+                for other in csp.neighbors[var]:
+                    if assignment.size(other) > 1:
+                        supports = csp.constraints[var][other].get(value)
+                        count += sum(1 for y in assignment[other] if y not in supports)
+            for k in csp.all_different_of[var]:
+                for other in csp.all_different[k]:
+                    if other != var and assignment.size(other) > 1 and assignment.contains(other, value):
+                        count += 1
+            ruled_out[value] = count
+        # sorted er stabil, så like verdier beholder rekkefølgen fra domenet
+        return sorted(values, key=ruled_out.get)
+
+
+# Navnene på heuristikkene som kan velges i CSP.backtracking_search()
+VARIABLE_ORDERINGS = {
+    'mrv': MinimumRemainingValues,
+    'mrv-degree': MinimumRemainingValuesDegree,
+    'dom/wdeg': DomainOverWeightedDegree,
+}
+VALUE_ORDERINGS = {
+    'domain': DomainOrder,
+    'lcv': LeastConstrainingValue,
+}
+
+
+class PartialSolution(dict):
+    """What CSP.backtracking_search() returns when it is stopped by a
+    limit before finding a solution: the domains from the deepest point
+    the search reached, in the same {var: [value, ...]} form as a
+    solution, where the undecided variables have more than one value.
+    'reason' tells which limit stopped the search, and 'stats' holds
+    the counters of the search.
+
+    A PartialSolution is false, like the False returned when there is no
+    solution, so code that only checks for a solution is not fooled.
+    """
+
+    def __init__(self, domains, reason, stats):
+        dict.__init__(self, domains)
+        self.reason = reason
+        self.stats = stats
+
+    def __nonzero__(self):
+        return False
+
+    __bool__ = __nonzero__
+
+    def decided(self):
+        """Get the number of variables with a single value left."""
+        return sum(1 for values in self.values() if len(values) == 1)
+
+
+class NogoodStore:
+    """The failures learned by conflict-directed backjumping. A nogood is
+    a frozenset of (var, value) decisions that can not all be part of a
+    solution, so a branch that makes all of them again is cut at once.
+
+    At most 'limit' nogoods are kept; when the store is full the least
+    recently used one is evicted. Every nogood is indexed by each of its
+    decisions, so the nogoods to check when a variable gets a value are
+    found with a single lookup.
+    """
+
+    def __init__(self, limit=10000):
+        self.limit = limit
+        self.nogoods = OrderedDict()
+        self.watches = {}
+        self.learned = 0
+        self.evicted = 0
+        self.hits = 0
+
+    def __len__(self):
+        return len(self.nogoods)
+
+    def add(self, decisions):
+        """Record that the (var, value) pairs in 'decisions' can not all
+        hold in a solution.
+        """
+        nogood = frozenset(decisions)
+        if not nogood or self.limit <= 0:
+            return
+        if nogood in self.nogoods:
+            del self.nogoods[nogood]
+            self.nogoods[nogood] = True
+            return
+        if len(self.nogoods) >= self.limit:
+            old, _ = self.nogoods.popitem(last=False)
+            for pair in old:
+                watching = self.watches[pair]
+                watching.discard(old)
+                if not watching:
+                    del self.watches[pair]
+            self.evicted += 1
+        self.nogoods[nogood] = True
+        for pair in nogood:
+            self.watches.setdefault(pair, set()).add(nogood)
+        self.learned += 1
+
+    def violated(self, assignment, var, value):
+        """Get a nogood that giving 'var' the value 'value' would make
+        true, i.e. one where every other variable is already reduced to
+        its value in 'assignment', or None if there is none.
+        """
+        for nogood in self.watches.get((var, value), ()):
+            for other, other_value in nogood:
+                if other != var and not (assignment.size(other) == 1 and
+                                         assignment.contains(other, other_value)):
+                    break
+            else:
+                self.hits += 1
+                del self.nogoods[nogood]
+                self.nogoods[nogood] = True
+                return nogood
+        return None
+
+
+class MinConflicts:
+    """The state of a min-conflicts local search on a CSP, see
+    CSP.min_conflicts(). Every variable has exactly one current value.
+    A binary constraint is violated when the pair of current values is
+    missing from its SupportTable, and a native Alldiff constraint once
+    for every pair of its variables sharing a value.
+
+    self.conflicts[var] is the number of violations involving var, kept
+    up to date by move() from the neighbours of the variable only, and
+    self.conflicted holds the variables that have violations and more
+    than one value to choose from, with self.positions[var] the index of
+    var in it, so a random one is picked in O(1).
+    """
+
+    def __init__(self, csp, domains, rng):
+        self.csp = csp
+        self.domains = domains
+        self.rng = rng
+        self.current = {}
+        self.conflicts = dict((var, 0) for var in csp.variables)
+        self.total = 0
+        self.counts = [ {} for _ in csp.all_different ]
+        self.conflicted = []
+        self.positions = {}
+        self.evaluations = 0
+
+    def restart(self):
+        """Give every variable a random value, then move each of them
+        once, in random order, to its value with the fewest conflicts.
+        """
+        csp = self.csp
+        self.current = dict((var, self.rng.choice(self.domains[var])) for var in csp.variables)
+        self.conflicts = dict((var, 0) for var in csp.variables)
+        self.counts = [ {} for _ in csp.all_different ]
+        for k, variables in enumerate(csp.all_different):
+            for var in variables:
+                value = self.current[var]
+                self.counts[k][value] = self.counts[k].get(value, 0) + 1
+        for var in csp.variables:
+            self.conflicts[var] = self.value_conflicts(var, self.current[var])
+        self.total = sum(self.conflicts.values())
+        self.conflicted = []
+        self.positions = {}
+        for var in csp.variables:
+            self.update(var)
+
+        order = list(csp.variables)
+        self.rng.shuffle(order)
+        for var in order:
+            if len(self.domains[var]) > 1:
+                self.move(var, self.best_value(var, keep=True))
+
+    def value_conflicts(self, var, value):
+        """Get the number of violations var would have with 'value',
+        while the other variables keep their current values.
+        """
+        csp = self.csp
+        current = self.current
+        count = 0
+        for j, table in csp.constraints[var].items():
+            if current[j] not in table.get(value):
+                count += 1
+        for k in csp.all_different_of[var]:
+            count += self.counts[k].get(value, 0)
+            if current[var] == value:
+                count -= 1
+        return count
+
+    def best_value(self, var, tabu=None, step=0, best_total=0, keep=False):
+        """Get the value of var with the fewest conflicts, breaking ties
+        at random. The current value is left out unless 'keep' is True,
+        so that a step never stands still on a plateau. Values in 'tabu'
+        until after 'step' are skipped too, unless they would give fewer
+        violations than 'best_total' (aspiration).
+        """
+        current = self.current[var]
+        best = []
+        best_count = None
+        for value in self.domains[var]:
+            if value == current and not keep:
+                continue
+            count = self.value_conflicts(var, value)
+            self.evaluations += 1
+            if tabu and tabu.get((var, value), 0) > step and \
+                    self.total + 2 * (count - self.conflicts[var]) >= best_total:
+                continue
+            if best_count is None or count < best_count:
+                best = [ value ]
+                best_count = count
+            elif count == best_count:
+                best.append(value)
+        if not best:
+            return current
+        return self.rng.choice(best)
+
+    def move(self, var, value):
+        """Give var the value 'value', and update the conflict counts of
+        var and its neighbours.
+        """
+        csp = self.csp
+        current = self.current
+        old = current[var]
+        if old == value:
+            return
+        conflicts = self.conflicts
+        for j, table in csp.constraints[var].items():
+            delta = (current[j] not in table.get(value)) - (current[j] not in table.get(old))
+            if delta:
+                conflicts[j] += delta
+                conflicts[var] += delta
+                self.total += 2 * delta
+                self.update(j)
+        for k in csp.all_different_of[var]:
+            counts = self.counts[k]
+            counts[old] -= 1
+            for other in csp.all_different[k]:
+                if other != var and current[other] == old:
+                    conflicts[other] -= 1
+                    conflicts[var] -= 1
+                    self.total -= 2
+                    self.update(other)
+                elif other != var and current[other] == value:
+                    conflicts[other] += 1
+                    conflicts[var] += 1
+                    self.total += 2
+                    self.update(other)
+            counts[value] = counts.get(value, 0) + 1
+        current[var] = value
+        self.update(var)
+
+    def update(self, var):
+        """Add var to or remove it from self.conflicted, after its
+        conflict count has changed.
+        """
+        positions = self.positions
+        wanted = self.conflicts[var] > 0 and len(self.domains[var]) > 1
+        if wanted and var not in positions:
+            positions[var] = len(self.conflicted)
+            self.conflicted.append(var)
+        elif not wanted and var in positions:
+            # flytter den siste variabelen inn på plassen til var
+            index = positions.pop(var)
+            last = self.conflicted.pop()
+            if last != var:
+                self.conflicted[index] = last
+                positions[last] = index
+
 
 class CSP:
     def __init__(self):
@@ -12,16 +676,108 @@ class CSP:
         # self.domains[i] is a list of legal values for variable i
         self.domains = {}
 
-        # self.constraints[i][j] is a list of legal value pairs for
-        # the variable pair (i, j)
+        # self.constraints[i][j] is a SupportTable holding the legal value
+        # pairs for the variable pair (i, j)
         self.constraints = {}
 
+        # self.all_different is a list of tuples of variables that must
+        # all have different values, propagated by
+        # propagate_all_different() instead of as binary constraints
+        self.all_different = []
+
         # Deliverable 3.:
         # The number of times your BACKTRACK function was called, and the number of times your BACKTRACK
         # function returned failure, for each of the four boards shown above
         self.backtrack_calls = 0
         self.backtrack_fails = 0
 
+        # The number of times REVISE was called, and the number of value
+        # pairs it checked against the constraints
+        self.revisions = 0
+        self.constraint_checks = 0
+
+        # The arc consistency algorithm used by inference(), 'ac3' or
+        # 'ac2001'. For 'ac2001', self.last_support[(i, j)][x] is the last
+        # value of j found to support the value x of i, see
+        # revise_residual().
+        self.arc_consistency = 'ac3'
+        self.last_support = {}
+
+        # The variable and value ordering heuristics of the current
+        # search, see backtracking_search(). self.constraint_weights
+        # counts how many times each constraint has wiped out a domain
+        # during inference(), keyed by frozenset((i, j)) for binary
+        # constraints and by the position in self.all_different for
+        # native ones; it is used by dom/wdeg.
+        self.variable_ordering = None
+        self.value_ordering = DomainOrder()
+        self.constraint_weights = {}
+
+        # The limits of the current search, see backtracking_search(),
+        # and how it ended: 'solved', 'unsatisfiable', 'node_limit',
+        # 'time_limit' or 'cancelled', or 'exhausted' and 'solution_limit'
+        # for iter_solutions() and count_solutions(). self.best_partial is
+        # a copy of the domains at the deepest point the search reached.
+        # self.search_start holds the counters (backtrack_calls,
+        # backtrack_fails, revisions, constraint_checks, assignments) from
+        # when the current search started, since they are never reset:
+        # the node limit and search_stats() only count that search.
+        self.node_limit = None
+        self.search_start = (0, 0, 0, 0, 0)
+        self.deadline = None
+        self.cancel = None
+        self.status = None
+        self.best_partial = None
+        self.best_depth = 0
+        self.search_time = 0.0
+        # The number of decisions made at the current node of the search
+        self.level = 0
+
+        # Conflict-directed backjumping, see backtracking_search(). While
+        # it is on, self.explanations[(var, value)] is the set of decision
+        # levels that caused the value to be removed from the domain of
+        # var, as a bitmask with bit 'level' set for each level, and
+        # self.conflict is the explanation of the last failed inference().
+        # Otherwise self.explanations is None and nothing is recorded.
+        self.explanations = None
+        self.conflict = 0
+        self.nogoods = None
+        self.backjumps = 0
+
+        # The number of moves and restarts of the last min_conflicts()
+        # search
+        self.steps = 0
+        self.restarts = 0
+
+        # The number of values tried by the backtracking search, and the
+        # Instrumentation that gets a SearchRecord for every search, if
+        # it is set (see finish_record())
+        self.assignments = 0
+        self.instrumentation = None
+
+        # Built by compile_bits() for the compact search mode:
+        # self.value_bits[value] is the bit interned for 'value', and
+        # self.bit_constraints[i][j][bit] is the bitmask of the values of
+        # j that support the value of i with bit 'bit'
+        self.value_bits = None
+        self.bit_values = None
+        self.bit_constraints = None
+
+        # The constraint graph, frozen by freeze() once the model is
+        # built: self.var_ids[name] is the integer id of a variable (its
+        # position in self.variables), self.neighbors[name] a tuple of its
+        # neighbours, self.arcs_into[name] a tuple of the arcs (z, name)
+        # and self.arcs a tuple of all arcs.
+        # self.all_different_of[name] is a tuple of the positions in
+        # self.all_different of the constraints on a variable.
+        # self.tie_orders caches the results of tie_ranks().
+        self.var_ids = None
+        self.tie_orders = None
+        self.neighbors = None
+        self.arcs_into = None
+        self.arcs = None
+        self.all_different_of = None
+
     def add_variable(self, name, domain):
         """Add a new variable to the CSP. 'name' is the variable name
         and 'domain' is a list of the legal values for the variable.
@@ -29,6 +785,8 @@ class CSP:
         self.variables.append(name)
         self.domains[name] = list(domain)
         self.constraints[name] = {}
+        self.bit_constraints = None
+        self.neighbors = None
 
     def get_all_possible_pairs(self, a, b):
         """Get a list of all possible pairs (as tuples) of the values in
@@ -42,15 +800,85 @@ class CSP:
         the CSP. The arcs/constraints are represented as tuples (i, j),
         indicating a constraint between variable 'i' and 'j'.
         """
-        return [ (i, j) for i in self.constraints for j in self.constraints[i] ]
+        if self.neighbors is None:
+            self.freeze()
+        return list(self.arcs)
 
     def get_all_neighboring_arcs(self, var):
         """Get a list of all arcs/constraints going to/from variable
         'var'. The arcs/constraints are represented as in get_all_arcs().
         """
-        return [ (i, var) for i in self.constraints[var] ]
+        if self.neighbors is None:
+            self.freeze()
+        return list(self.arcs_into[var])
 
-    def add_constraint_one_way(self, i, j, filter_function):
+    def freeze(self):
+        """Build the precomputed adjacency structure of the constraint
+        graph (see __init__), so that the search can walk the neighbours
+        of a variable without building any lists. This is done
+        automatically when the graph is needed after the model has
+        changed.
+        """
+        var_ids = dict((name, k) for k, name in enumerate(self.variables))
+        neighbors = {}
+        for name in self.variables:
+            neighbors[name] = tuple(self.constraints[name])
+
+        self.var_ids = var_ids
+        self.tie_orders = [[], {}, None]
+        self.arcs_into = dict((name, tuple((z, name) for z in neighbors[name]))
+                              for name in self.variables)
+        self.arcs = tuple((i, j) for i in self.variables for j in neighbors[i])
+
+        all_different_of = dict((name, []) for name in self.variables)
+        for k, variables in enumerate(self.all_different):
+            for name in variables:
+                all_different_of[name].append(k)
+        self.all_different_of = dict((name, tuple(ks)) for name, ks in all_different_of.items())
+        self.neighbors = neighbors
+
+    def tie_ranks(self, level):
+        """Get the order in which MRV breaks ties between variables
+        after 'level' decisions, as an array of ranks indexed by the ids
+        in self.var_ids.
+
+        The original solver took the first of the variables with the
+        fewest values in the order of its dictionary of domains, and made
+        a deep copy of the dictionary for every decision. Python 2 can
+        change the order of the keys when a dictionary is copied, so the
+        order at a node is that of the domains after 'level' + 1 copies.
+        The same copies are made here, once for every level, and the
+        orders are reused when they start to repeat.
+        """
+        orders, seen, repeat = self.tie_orders
+        while repeat is None and len(orders) <= level:
+            if orders:
+                keys = orders[-1][1]
+            else:
+                keys = {}
+                for var in self.variables:
+                    keys[var] = None
+            # en kopi av ordboken, slik som copy.deepcopy() lager den
+            copied = {}
+            for var in keys:
+                copied[var] = None
+            order = tuple(copied)
+            if order in seen:
+                # fra nå av går rekkefølgene i ring
+                repeat = self.tie_orders[2] = seen[order]
+                break
+            seen[order] = len(orders)
+            ranks = array('i', [0]) * len(order)
+            for rank, var in enumerate(order):
+                ranks[self.var_ids[var]] = rank
+            orders.append((ranks, order))
+
+        if level >= len(orders):
+            level = repeat + (level - repeat) % (len(orders) - repeat)
+        return orders[level][0]
+
+    def add_constraint_one_way(self, i, j, filter_function, intensional=False,
+                               cache_size=100000):
         """Add a new constraint between variables 'i' and 'j'. The legal
         values are specified by supplying a function 'filter_function',
         that returns True for legal value pairs and False for illegal
@@ -58,49 +886,313 @@ class CSP:
         from i -> j. You must ensure that the function also gets called
         to add the constraint the other way, j -> i, as all constraints
         are supposed to be two-way connections!
+
+        If 'intensional' is True, 'filter_function' is kept in a
+        PredicateTable and only called for the pairs the search checks,
+        with at most 'cache_size' results memoised, instead of being
+        called for every pair of values up front. Use it for large
+        domains, where the value pairs would not fit in memory. A second
+        constraint on the same arc is combined with the first one.
         """
+        if intensional:
+            if j in self.constraints[i]:
+                old = self.constraints[i][j]
+                predicate = lambda x, y: (x, y) in old and filter_function(x, y)
+            else:
+                predicate = filter_function
+            self.constraints[i][j] = PredicateTable(predicate, self.domains[i], self.domains[j],
+                                                    cache_size)
+            self.bit_constraints = None
+            self.neighbors = None
+            return
+
         if not j in self.constraints[i]:
             # First, get a list of all possible pairs of values between variables i and j
-            self.constraints[i][j] = self.get_all_possible_pairs(self.domains[i], self.domains[j])
+            value_pairs = self.get_all_possible_pairs(self.domains[i], self.domains[j])
+        else:
+            value_pairs = self.constraints[i][j]
 
-        # Next, filter this list of value pairs through the function
-        # 'filter_function', so that only the legal value pairs remain
-        self.constraints[i][j] = filter(lambda value_pair: filter_function(*value_pair), self.constraints[i][j])
+        # Next, filter the value pairs through the function 'filter_function',
+        # so that only the legal value pairs remain, and index them by the
+        # value of i
+        self.constraints[i][j] = SupportTable(value_pair for value_pair in value_pairs
+                                              if filter_function(*value_pair))
+        self.bit_constraints = None
+        self.neighbors = None
 
-    def add_all_different_constraint(self, variables):
+    def instantiate(self, domains):
+        """Get a new CSP with the same variables and constraints as this
+        one, where the domains of the variables in the dictionary
+        'domains' are replaced. The constraints, the frozen constraint
+        graph and the compact mode tables are shared with this CSP
+        instead of being built again, so this CSP works as a template
+        for many instances of the same problem. Constraints must not be
+        added to the new CSP, as they would be added to this one too.
+        """
+        if self.neighbors is None:
+            self.freeze()
+
+        csp = CSP()
+        csp.variables = self.variables
+        csp.constraints = self.constraints
+        csp.all_different = self.all_different
+        csp.domains = dict(self.domains)
+        for var, domain in domains.items():
+            csp.domains[var] = list(domain)
+
+        csp.var_ids = self.var_ids
+        csp.tie_orders = self.tie_orders
+        csp.neighbors = self.neighbors
+        csp.arcs_into = self.arcs_into
+        csp.arcs = self.arcs
+        csp.all_different_of = self.all_different_of
+        csp.value_bits = self.value_bits
+        csp.bit_values = self.bit_values
+        csp.bit_constraints = self.bit_constraints
+        csp.instrumentation = self.instrumentation
+        return csp
+
+    def compile_bits(self):
+        """Intern every value of the CSP to a bit position, and build the
+        bitmask version of the constraints used by the compact search
+        mode. Values get their bits in the order they are first seen,
+        starting with the largest domains, so that the values of a decoded
+        domain keep the order they were added in.
+        """
+        value_bits = {}
+        for var in sorted(self.variables, key=lambda var: -len(self.domains[var])):
+            for value in self.domains[var]:
+                if value not in value_bits:
+                    value_bits[value] = 1 << len(value_bits)
+        if len(value_bits) > 64:
+            raise ValueError('The compact mode supports at most 64 distinct values, got %d'
+                             % len(value_bits))
+
+        bit_constraints = {}
+        for i in self.constraints:
+            bit_constraints[i] = {}
+            for j, table in self.constraints[i].items():
+                masks = {}
+                for x, y in table:
+                    masks[value_bits[x]] = masks.get(value_bits[x], 0) | value_bits[y]
+                bit_constraints[i][j] = masks
+
+        self.value_bits = value_bits
+        self.bit_values = dict((bit, value) for value, bit in value_bits.items())
+        self.bit_constraints = bit_constraints
+
+    def add_all_different_constraint(self, variables, native=False):
         """Add an Alldiff constraint between all of the variables in the
         list 'variables'.
+
+        By default the constraint is expanded into binary constraints
+        between every pair of the variables. If 'native' is True, it is
+        kept as a single constraint and propagated by
+        propagate_all_different() instead, which needs no value pair
+        tables and prunes more, and so scales to large domains.
         """
+        if native:
+            self.all_different.append(tuple(variables))
+            self.neighbors = None
+            return
+
         for (i, j) in self.get_all_possible_pairs(variables, variables):
             if i != j:
                 self.add_constraint_one_way(i, j, lambda x, y: x != y)
 
-    def backtracking_search(self):
+    def backtracking_search(self, compact=False, arc_consistency='ac3',
+                            variable_ordering='mrv', value_ordering='domain',
+                            node_limit=None, time_limit=None, cancel=None,
+                            backjumping=False, nogood_limit=10000):
         """This functions starts the CSP solver and returns the found
         solution.
+
+        If 'compact' is True, the domains are stored as bitmasks during
+        the search (see BitDomains). This requires that the CSP has at
+        most 64 distinct values, and gives the same solution.
+
+        'arc_consistency' selects the algorithm used by inference():
+        'ac3', or 'ac2001' which remembers the last support found for
+        every value and checks it first the next time the arc is revised
+        (AC-3 with residual supports, see revise_residual()).
+
+        'variable_ordering' and 'value_ordering' select the heuristics
+        used by select_unassigned_variable() and order_domain_values().
+        They are either names from VARIABLE_ORDERINGS ('mrv',
+        'mrv-degree', 'dom/wdeg') and VALUE_ORDERINGS ('domain', 'lcv'),
+        or objects with the same methods as the classes there.
+
+        The search can be stopped before it finishes: 'node_limit' is
+        the largest number of backtrack calls in this search, 'time_limit'
+        the number of seconds, and 'cancel' a function (e.g.
+        threading.Event.is_set) that is checked at every step and stops
+        the search when it returns True. When that happens a PartialSolution is returned
+        instead of the solution. It is false like a failed search, and
+        holds the domains from the deepest point of the search, together
+        with the reason and the counters from search_stats().
+
+        If 'backjumping' is True, the search does conflict-directed
+        backjumping instead of chronological backtracking: every value
+        removed during the search is explained by the decisions that
+        caused it, and when a variable runs out of values the search
+        jumps straight back to the latest decision in its conflict set.
+        The conflict sets are also learned as nogoods, of which at most
+        'nogood_limit' are kept (see NogoodStore).
         """
-        # Make a so-called "deep copy" of the dictionary containing the
-        # domains of the CSP variables. The deep copy is required to
-        # ensure that any changes made to 'assignment' does not have any
-        # side effects elsewhere.
-        assignment = copy.deepcopy(self.domains)
+        solutions = self.iter_solutions(compact, arc_consistency, variable_ordering,
+                                        value_ordering, node_limit, time_limit, cancel,
+                                        backjumping, nogood_limit)
+        for solution in solutions:
+            solutions.close()
+            return solution
+        if self.status != 'unsatisfiable':
+            return PartialSolution(self.best_partial, self.status, self.search_stats())
+        return False
+
+    def iter_solutions(self, compact=False, arc_consistency='ac3',
+                       variable_ordering='mrv', value_ordering='domain',
+                       node_limit=None, time_limit=None, cancel=None,
+                       backjumping=False, nogood_limit=10000):
+        """Generate the solutions of the CSP one at a time, in the same
+        form as backtracking_search(), which takes the same options.
+
+        AC-3 runs on the whole CSP once, and every next solution is
+        searched for from the point where the previous one was found,
+        with the same domains and trail. Nothing is searched before the
+        generator is advanced, so stopping early stops the search.
+
+        When the generator ends, self.status is 'exhausted' if every
+        solution has been generated, 'unsatisfiable' if there were none,
+        or the limit that stopped the search. self.search_time only
+        counts the time spent inside the generator.
+        """
+        start = time.time()
+        if arc_consistency not in ('ac3', 'ac2001'):
+            raise ValueError('Unknown arc consistency algorithm: %r' % (arc_consistency,))
+        self.arc_consistency = arc_consistency
+        self.last_support = {}
+        self.constraint_weights = {}
+
+        if isinstance(variable_ordering, basestring):
+            if variable_ordering not in VARIABLE_ORDERINGS:
+                raise ValueError('Unknown variable ordering: %r' % (variable_ordering,))
+            variable_ordering = VARIABLE_ORDERINGS[variable_ordering]()
+        if isinstance(value_ordering, basestring):
+            if value_ordering not in VALUE_ORDERINGS:
+                raise ValueError('Unknown value ordering: %r' % (value_ordering,))
+            value_ordering = VALUE_ORDERINGS[value_ordering]()
+        self.value_ordering = value_ordering
+
+        record = None
+        if self.instrumentation is not None:
+            record = self.instrumentation.start(
+                'solve', solver='backtracking', compact=compact, arc_consistency=arc_consistency,
+                variable_ordering=variable_ordering.__class__.__name__,
+                value_ordering=value_ordering.__class__.__name__, backjumping=backjumping)
+            before = self.counter_values()
+
+        self.node_limit = node_limit
+        self.search_start = self.search_counters()
+        self.deadline = start + time_limit if time_limit is not None else None
+        self.cancel = cancel
+        self.status = None
+        self.best_partial = None
+        self.best_depth = 0
+        self.explanations = None
+        self.nogoods = NogoodStore(nogood_limit if backjumping else 0)
+        self.backjumps = 0
+
+        # Copy the domains of the CSP variables into a Domains object, so
+        # that any changes made to 'assignment' does not have any side
+        # effects elsewhere, and so that they can be undone when the
+        # search backtracks.
+        if compact:
+            if self.bit_constraints is None:
+                self.compile_bits()
+            assignment = BitDomains(self.domains, self.value_bits, self.bit_values)
+        else:
+            assignment = Domains(self.domains)
 
         # Run AC-3 on all constraints in the CSP, to weed out all of the
         # values that are not arc-consistent to begin with
-        self.inference(assignment, self.get_all_arcs())
+        if self.neighbors is None:
+            self.freeze()
+        setup = time.time() - start
+        if not self.inference(assignment, self.arcs, self.variables):
+            self.status = 'unsatisfiable'
+            self.search_time = time.time() - start
+            if record is not None:
+                self.finish_record(record, before, setup=setup, ac3=self.search_time - setup)
+            return
+        self.best_partial = assignment.solution()
+        self.search_time = time.time() - start
+        root = self.search_time
+
+        self.variable_ordering = variable_ordering
+        variable_ordering.start(self, assignment)
 
-        # Call backtrack with the partial assignment 'assignment'
-        return self.backtrack(assignment)
+        # Values removed by the AC-3 above have no explanation, since they
+        # do not depend on any decision
+        if backjumping:
+            self.explanations = {}
+
+        # Call backtrack with the partial assignment 'assignment', through
+        # search_solutions() so that the search can go on after a solution
+        try:
+            clock = time.time()
+            for solved in self.search_solutions(assignment):
+                self.search_time += time.time() - clock
+                clock = None
+                yield solved.solution()
+                clock = time.time()
+        finally:
+            assignment.watch = None
+            self.explanations = None
+            self.variable_ordering = None
+            if clock is not None:
+                self.search_time += time.time() - clock
+            if record is not None:
+                self.finish_record(record, before, setup=setup, ac3=root - setup,
+                                   search=self.search_time - root)
+
+    def count_solutions(self, limit=None, **search_options):
+        """Count the solutions of the CSP, stopping as soon as 'limit'
+        solutions have been found, in which case self.status is set to
+        'solution_limit'. The other options are the same as for
+        backtracking_search(); if a limit there stops the search, the
+        count only includes the solutions found so far. Like there, the
+        node limit only counts the backtrack calls of this enumeration,
+        not those of earlier searches of the CSP.
+        """
+        count = 0
+        solutions = self.iter_solutions(**search_options)
+        for _ in solutions:
+            count += 1
+            if limit is not None and count >= limit:
+                solutions.close()
+                self.status = 'solution_limit'
+                break
+        return count
+
+    def has_unique_solution(self, **search_options):
+        """Check if the CSP has exactly one solution, e.g. to check that a
+        Sudoku puzzle is valid. The search stops at the second solution.
+        Returns None if a limit from 'search_options' stopped the search
+        before the answer was known.
+        """
+        count = self.count_solutions(limit=2, **search_options)
+        if self.status not in ('exhausted', 'unsatisfiable', 'solution_limit'):
+            return None
+        return count == 1
 
     def backtrack(self, assignment):
         """The function 'Backtrack' from the pseudocode in the
         textbook.
 
-        The function is called recursively, with a partial assignment of
-        values 'assignment'. 'assignment' is a dictionary that contains
-        a list of all legal values for the variables that have *not* yet
-        been decided, and a list of only a single value for the
-        variables that *have* been decided.
+        'assignment' is a dictionary that contains a list of all legal
+        values for the variables that have *not* yet been decided, and a
+        list of only a single value for the variables that *have* been
+        decided.
 
         When all of the variables in 'assignment' have lists of length
         one, i.e. when all variables have been assigned a value, the
@@ -109,39 +1201,391 @@ class CSP:
         the AC-3 algorithm, the lists of legal values in 'assignment'
         should get reduced as AC-3 discovers illegal values.
 
-        IMPORTANT: For every iteration of the for-loop in the
-        pseudocode, you need to make a deep copy of 'assignment' into a
-        new variable before changing it. Every iteration of the for-loop
-        should have a clean slate and not see any traces of the old
-        assignments and inferences that took place in previous
-        iterations of the loop.
+        Instead of calling itself recursively, the function keeps an
+        explicit stack with one frame per decided variable: the variable,
+        the values to try, the next value and the trail mark from before
+        the variable was assigned. The number of variables is then not
+        limited by Python's recursion limit. backtrack_calls and
+        backtrack_fails are counted as if it was recursive: a call for
+        every frame pushed and a failure for every frame that runs out
+        of values.
+
+        Every value starts with a clean slate: the values removed by the
+        assignment and by the inferences are recorded on the trail of
+        'assignment', and are put back with assignment.undo() before the
+        next value is tried.
+
+        With conflict-directed backjumping, every frame also collects the
+        conflict set of its variable: the decision levels that explain
+        why its values failed. The value of the variable at level L is
+        explained by bit L. A frame that runs out of values is handed to
+        backjump(), and a value that would make a learned nogood true is
+        skipped without running inference().
+
+        If a limit set by backtracking_search() is reached, self.status
+        is set and False is returned, and self.best_partial holds the
+        domains from the deepest point of the search.
+
+        The search itself is done by search_solutions(), of which only
+        the first solution is used here.
+        """
+        for solution in self.search_solutions(assignment):
+            return solution
+        return False
+
+    def search_solutions(self, assignment):
+        """Generate every solution below 'assignment', as in backtrack().
+        'assignment' itself is yielded each time all variables have been
+        decided, and the search goes on with the next value when the
+        generator is resumed, so the caller must copy the solution
+        before that.
+
+        With backjumping, the conflict set of every frame on the stack
+        gets all of the levels before it once a solution is found, as a
+        jump past a decision could skip other solutions.
         """
-        # TODO: IMPLEMENT THIS
         # pseudokode s.215 i boken
         self.backtrack_calls += 1
         # hvis lengden til element eller hver variabel i assignment har lister av lengde 1,
-        # så er assignment complete
-        complete = True
-        for i in assignment:
-            if len(assignment[i]) > 1:
-                complete = False
-        if complete:
-            return assignment
-
+        # så er assignment complete, og det finnes ingen variabel å velge
+        self.level = 0
         var = self.select_unassigned_variable(assignment)
-        for value in assignment[var]:
-            new_assignment = copy.deepcopy(assignment)
-            new_assignment[var] = [value]
-            neighbouring_arcs = self.get_all_neighboring_arcs(var)
-            if self.inference(new_assignment, neighbouring_arcs):
-                # assignment.append(inferences)
-                result = self.backtrack(new_assignment)
-                if result:
-                    return result
-            # assignment.pop([value])    ikke nødvendig pga deepcopy
-            # assignment.pop(self.inference(var, value))
-        self.backtrack_fails += 1
-        return False
+        if var is None:
+            self.status = 'solved'
+            yield assignment
+            self.status = 'exhausted'
+            return
+
+        backjumping = self.explanations is not None
+        found = False
+        stack = [ [var, self.order_domain_values(assignment, var), 0, assignment.mark(), 0] ]
+        while stack:
+            stop = self.search_limit_reached()
+            if stop:
+                self.status = stop
+                return
+
+            frame = stack[-1]
+            var, values, k, mark, conflict = frame
+            # fjerner forrige verdi og alle inferensene igjen
+            assignment.undo(mark)
+            if k == len(values):
+                self.backtrack_fails += 1
+                stack.pop()
+                if backjumping and not self.backjump(assignment, stack, var, conflict):
+                    break
+                continue
+            frame[2] = k + 1
+
+            if backjumping:
+                level = 1 << len(stack)
+                nogood = self.nogoods.violated(assignment, var, values[k])
+                if nogood is not None:
+                    frame[4] |= self.decisions_reason(assignment, nogood, var) & ~level
+                    continue
+                for value in assignment.values_of(var):
+                    if value != values[k]:
+                        self.explanations[(var, value)] = level
+
+            self.assignments += 1
+            assignment.assign(var, values[k])
+            if not self.inference(assignment, self.arcs_into[var], (var,)):
+                if backjumping:
+                    frame[4] |= self.conflict & ~level
+                continue
+
+            self.backtrack_calls += 1
+            self.level = len(stack)
+            var = self.select_unassigned_variable(assignment)
+            if var is None:
+                self.status = 'solved'
+                yield assignment
+                found = True
+                if backjumping:
+                    for level, frame in enumerate(stack, 1):
+                        frame[4] |= (1 << level) - 2
+                continue
+            stack.append([var, self.order_domain_values(assignment, var), 0, assignment.mark(), 0])
+            if len(stack) > self.best_depth:
+                self.best_depth = len(stack)
+                self.best_partial = assignment.solution()
+
+        self.status = 'exhausted' if found else 'unsatisfiable'
+
+    def backjump(self, assignment, stack, var, conflict):
+        """Jump back from 'var', which has run out of values, to the
+        latest decision in its conflict set. 'stack' holds the frames of
+        the decisions before 'var', and 'conflict' the conflict set
+        collected from its failed values. The values removed from the
+        domain of 'var' before it was chosen are explained too, so they
+        are added to the conflict set.
+
+        The frames after the culprit are dropped, the rest of the
+        conflict set is handed on to the culprit, and the decisions in it
+        are learned as a nogood. Returns False if the conflict set is
+        empty, as the CSP then has no solution at all.
+        """
+        level = len(stack) + 1
+        conflict = (conflict | self.removal_reason(assignment, var)) & ~(1 << level)
+        if not conflict:
+            return False
+
+        culprit = conflict.bit_length() - 1
+        self.nogoods.add((frame[0], frame[1][frame[2] - 1])
+                         for depth, frame in enumerate(stack, 1) if conflict >> depth & 1)
+        if culprit < len(stack):
+            # hopper over variablene som ikke hadde noe med feilen å gjøre
+            self.backjumps += 1
+            del stack[culprit:]
+        stack[-1][4] |= conflict & ~(1 << culprit)
+        return True
+
+    def removal_reason(self, assignment, var):
+        """Get the decision levels that explain every value removed so
+        far from the domain of 'var', as a bitmask. Values that were
+        never removed during the search have no explanation.
+        """
+        explanations = self.explanations
+        reason = 0
+        for value in self.domains[var]:
+            if not assignment.contains(var, value):
+                reason |= explanations.get((var, value), 0)
+        return reason
+
+    def support_reason(self, assignment, i, j, x):
+        """Get the decision levels that explain why the value 'x' of 'i'
+        (a bit in the compact mode) has no support left in the domain of
+        'j': the explanations of its supports that have been removed.
+        """
+        explanations = self.explanations
+        reason = 0
+        if assignment.compact:
+            lost = self.bit_constraints[i][j].get(x, 0) & ~assignment[j]
+            while lost:
+                bit = lost & -lost
+                reason |= explanations.get((j, self.bit_values[bit]), 0)
+                lost ^= bit
+        else:
+            supports_x = self.constraints[i][j].get(x)
+            domain_j = set(assignment[j])
+            for y in self.domains[j]:
+                if y not in domain_j and y in supports_x:
+                    reason |= explanations.get((j, y), 0)
+        return reason
+
+    def scope_reason(self, assignment, variables):
+        """Get the decision levels that explain the current domains of all
+        of 'variables', used for the native Alldiff constraints.
+        """
+        reason = 0
+        for var in variables:
+            reason |= self.removal_reason(assignment, var)
+        return reason
+
+    def decisions_reason(self, assignment, decisions, var):
+        """Get the decision levels that explain why the variables of the
+        (var, value) pairs in 'decisions', other than 'var', are reduced
+        to their values.
+        """
+        reason = 0
+        for other, value in decisions:
+            if other != var:
+                reason |= self.removal_reason(assignment, other)
+        return reason
+
+    def search_limit_reached(self):
+        """Check the limits of the current search, and get the reason to
+        stop ('node_limit', 'time_limit' or 'cancelled'), or None if the
+        search can go on.
+        """
+        if self.node_limit is not None and self.backtrack_calls - self.search_start[0] >= self.node_limit:
+            return 'node_limit'
+        if self.deadline is not None and time.time() >= self.deadline:
+            return 'time_limit'
+        if self.cancel is not None and self.cancel():
+            return 'cancelled'
+        return None
+
+    def search_counters(self):
+        """Get the counters that search_stats() reports, as a tuple in
+        the order of self.search_start.
+        """
+        return (self.backtrack_calls, self.backtrack_fails, self.revisions,
+                self.constraint_checks, self.assignments)
+
+    def search_stats(self):
+        """Get the counters of the last search as a dictionary. Unlike
+        the attributes, which add up over every search of the CSP, they
+        only count the last search.
+        """
+        calls, fails, revisions, checks, assignments = [
+            after - start for after, start in zip(self.search_counters(), self.search_start) ]
+        return {
+            'status': self.status,
+            'backtrack_calls': calls,
+            'backtrack_fails': fails,
+            'revisions': revisions,
+            'constraint_checks': checks,
+            'assignments': assignments,
+            'backjumps': self.backjumps,
+            'nogoods': self.nogoods.learned if self.nogoods is not None else 0,
+            'nogood_hits': self.nogoods.hits if self.nogoods is not None else 0,
+            'steps': self.steps,
+            'restarts': self.restarts,
+            'seconds': self.search_time,
+        }
+
+    def counter_values(self):
+        """Get the counters of the CSP that finish_record() reads, as a
+        tuple. They are never reset, so a search is measured by the
+        difference from before it started.
+        """
+        hits = 0
+        for i in self.variables:
+            for table in self.constraints[i].values():
+                if isinstance(table, PredicateTable):
+                    hits += table.hits
+        return (self.backtrack_calls, self.assignments, self.constraint_checks,
+                self.backtrack_fails, self.revisions, hits)
+
+    def finish_record(self, record, before, nodes=None, successors=None, evaluations=0,
+                      conflicts=None, **phases):
+        """Fill in the SearchRecord of the search that has just ended,
+        with what it added to the counters since 'before' (from
+        counter_values()) and the seconds spent in each of 'phases', and
+        pass it on to self.instrumentation. For the backtracking search
+        the nodes are the backtrack calls, the successors the values
+        tried, the evaluations the constraint checks and the prunings
+        the failed backtrack calls. The cache hits are those of the
+        PredicateTables and of the nogoods.
+        """
+        calls, assignments, checks, fails, revisions, hits = [
+            after - start for after, start in zip(self.counter_values(), before) ]
+        record.count('nodes', calls if nodes is None else nodes)
+        record.count('successors', assignments if successors is None else successors)
+        record.count('evaluations', checks + evaluations)
+        record.count('prunings', fails)
+        record.count('revisions', revisions)
+        record.count('cache_hits', hits + (self.nogoods.hits if self.nogoods is not None else 0))
+        for phase in ('setup', 'ac3', 'search'):
+            if phase in phases:
+                self.instrumentation.phase(record, phase, phases[phase])
+
+        info = dict(status=self.status, backjumps=self.backjumps, steps=self.steps,
+                    restarts=self.restarts)
+        if conflicts is not None:
+            info['conflicts'] = conflicts
+        self.instrumentation.finish(record, **info)
+
+    def min_conflicts(self, max_steps=100000, tabu_tenure=2, restart_after=1000,
+                      time_limit=None, cancel=None, seed=None):
+        """Solve the CSP with min-conflicts local search instead of
+        backtracking, and return the solution in the same form as
+        backtracking_search(). It is much faster on large, loosely
+        constrained problems, but can not prove that there is no
+        solution.
+
+        After AC-3 on the whole CSP, every variable gets a value (see
+        MinConflicts.restart()). Then every step picks a random variable
+        that has conflicts and moves it to its value with the fewest
+        conflicts among the other values. A variable may not go back to
+        the value it left for 'tabu_tenure' steps, unless that gives fewer conflicts than the
+        best assignment so far. After 'restart_after' steps without a
+        new best, the search restarts from new random values.
+
+        If no solution is found within 'max_steps' steps, 'time_limit'
+        seconds, or before 'cancel' returns True, a PartialSolution is
+        returned with the complete assignment that had the fewest
+        conflicts and the reason 'step_limit', 'time_limit' or
+        'cancelled', and the number of violated constraints as
+        stats['conflicts']. 'seed' makes the search repeatable.
+        """
+        start = time.time()
+        self.node_limit = None
+        self.search_start = self.search_counters()
+        self.deadline = start + time_limit if time_limit is not None else None
+        self.cancel = cancel
+        self.status = None
+        self.steps = 0
+        self.restarts = 0
+        self.nogoods = None
+        self.backjumps = 0
+
+        record = None
+        if self.instrumentation is not None:
+            record = self.instrumentation.start('solve', solver='min_conflicts', max_steps=max_steps,
+                                                tabu_tenure=tabu_tenure, restart_after=restart_after)
+            before = self.counter_values()
+
+        if self.neighbors is None:
+            self.freeze()
+        assignment = Domains(self.domains)
+        if not self.inference(assignment, self.arcs, self.variables):
+            self.status = 'unsatisfiable'
+            self.search_time = time.time() - start
+            if record is not None:
+                self.finish_record(record, before, ac3=self.search_time)
+            return False
+        root = time.time() - start
+
+        rng = random.Random(seed)
+        search = MinConflicts(self, assignment, rng)
+        search.restart()
+        best_total = run_best = search.total
+        best = dict(search.current)
+        since_best = 0
+        tabu = {}
+        while search.total > 0:
+            if not search.conflicted:
+                # bare variabler med én verdi er i konflikt
+                self.status = 'unsatisfiable'
+                break
+            if self.steps >= max_steps:
+                self.status = 'step_limit'
+                break
+            stop = self.search_limit_reached()
+            if stop:
+                self.status = stop
+                break
+
+            self.steps += 1
+            var = rng.choice(search.conflicted)
+            old = search.current[var]
+            value = search.best_value(var, tabu, self.steps, best_total)
+            if value != old:
+                tabu[(var, old)] = self.steps + tabu_tenure
+                search.move(var, value)
+
+            if search.total < best_total:
+                best_total = search.total
+                best = dict(search.current)
+            if search.total < run_best:
+                run_best = search.total
+                since_best = 0
+            else:
+                since_best += 1
+                if since_best >= restart_after:
+                    self.restarts += 1
+                    tabu = {}
+                    search.restart()
+                    run_best = search.total
+                    since_best = 0
+        if search.total == 0:
+            self.status = 'solved'
+
+        self.search_time = time.time() - start
+        if record is not None:
+            self.finish_record(record, before, nodes=self.steps, successors=self.steps,
+                               evaluations=search.evaluations, conflicts=best_total // 2,
+                               ac3=root, search=self.search_time - root)
+        if self.status == 'solved':
+            return dict((var, [ value ]) for var, value in search.current.items())
+        if self.status == 'unsatisfiable':
+            return False
+        stats = self.search_stats()
+        stats['conflicts'] = best_total // 2
+        return PartialSolution(dict((var, [ value ]) for var, value in best.items()),
+                               self.status, stats)
 
 # -----------------------------------------------------------------------------
 
@@ -150,38 +1594,313 @@ class CSP:
         """The function 'Select-Unassigned-Variable' from the pseudocode
         in the textbook. Should return the name of one of the variables
         in 'assignment' that have not yet been decided, i.e. whose list
-        of legal values has a length greater than one.
+        of legal values has a length greater than one, or None if all
+        of them have been decided.
+
+        During backtracking_search() the variable is chosen by the
+        selected variable ordering heuristic. Otherwise the variables are
+        scanned for the one with the fewest legal values (MRV), with ties
+        broken as in MinimumRemainingValues after self.level decisions.
         """
+        if self.variable_ordering is not None:
+            return self.variable_ordering.select(self, assignment)
+        if self.neighbors is None:
+            self.freeze()
 
         # ettersom vi kan få flere variabler som ikke er bestemte, så legges de i en liste
         undecided = []
 
-        for x in assignment.keys(): # keys() When looping through dictionaries
-            if len(assignment[x]) > 1:
+        for x in self.variables:
+            if assignment.size(x) > 1:
                 undecided.append(x)
 
+        if not undecided:
+            return None
+
         # velger å returnere den minste ubestemte variabelen fra listen, MRV
         # varibelen med færre "legal" values
-        return min(undecided, key = lambda key: len(assignment[key]))
+        ranks = self.tie_ranks(self.level)
+        return min(undecided, key = lambda x: (assignment.size(x), ranks[self.var_ids[x]]))
+
+    def order_domain_values(self, assignment, var):
+        """The function 'Order-Domain-Values' from the pseudocode in the
+        textbook. Returns a new list of the legal values of 'var', in the
+        order given by the selected value ordering heuristic.
+        """
+        return self.value_ordering.order(self, assignment, var)
 
 # -----------------------------------------------------------------------------
 
-    def inference(self, assignment, queue):
+    def inference(self, assignment, queue, changed=()):
         """The function 'AC-3' from the pseudocode in the textbook.
         'assignment' is the current partial assignment, that contains
         the lists of legal values for each undecided variable. 'queue'
         is the initial queue of arcs that should be visited.
+
+        The arcs are kept in a FIFO worklist together with the set of
+        arcs currently in it, so an arc is never queued twice. 'queue'
+        itself is not changed.
+
+        'changed' lists the variables whose domains have changed, so that
+        their native Alldiff constraints are propagated too. Whenever a
+        domain shrinks, both the arcs into the variable and its native
+        constraints are queued again.
         """
+        if self.neighbors is None:
+            self.freeze()
+        arcs_into = self.arcs_into
+        all_different_of = self.all_different_of
+
+        worklist = deque()
+        queued = set()
+        for arc in queue:
+            if arc not in queued:
+                queued.add(arc)
+                worklist.append(arc)
 
-        while len(queue) > 0: # queue[0] != ''
-            x, y = queue.pop()
-            if self.revise(assignment, x, y):
-                if len(assignment[x]) == 0:
+        pending = deque()
+        pending_set = set()
+        for var in changed:
+            for k in all_different_of[var]:
+                if k not in pending_set:
+                    pending_set.add(k)
+                    pending.append(k)
+
+        while worklist or pending:
+            if worklist:
+                arc = worklist.popleft()
+                queued.discard(arc)
+                x, y = arc
+                if not self.revise(assignment, x, y):
+                    continue
+                if assignment.size(x) == 0:
+                    key = frozenset(arc)
+                    self.constraint_weights[key] = self.constraint_weights.get(key, 1) + 1
+                    if self.explanations is not None:
+                        self.conflict = self.removal_reason(assignment, x)
+                    return False
+                revised = (x,)
+            else:
+                k = pending.popleft()
+                pending_set.discard(k)
+                revised = self.propagate_all_different(assignment, self.all_different[k])
+                if revised is None:
+                    self.constraint_weights[k] = self.constraint_weights.get(k, 1) + 1
+                    if self.explanations is not None:
+                        self.conflict = self.scope_reason(assignment, self.all_different[k])
                     return False
-                # !!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!
-                for z1, z2 in self.get_all_neighboring_arcs(x): # det er nabo-Arkene vi ønsker
-                    if z1 != y:
-                        queue.append((z1, x)) # legger til tuppel
+                y = None
+
+            for x in revised:
+                # det er nabo-arkene (z, x) vi ønsker å sjekke på nytt
+                for arc in arcs_into[x]:
+                    if arc[0] != y and arc not in queued:
+                        queued.add(arc)
+                        worklist.append(arc)
+                for k in all_different_of[x]:
+                    if k not in pending_set:
+                        pending_set.add(k)
+                        pending.append(k)
+        return True
+
+    def propagate_all_different(self, assignment, variables):
+        """Propagate the native Alldiff constraint on 'variables', and get
+        a list of the variables whose domains were reduced, or None if
+        the constraint can not be satisfied anymore. Three rules are used
+        until none of them change anything:
+
+        - naked single: a decided variable's value is removed from the
+          domains of all of the other variables
+        - hidden single: when there are exactly as many values as
+          variables, every value must be used, so a value that only one
+          variable can take is assigned to that variable
+        - matching: the variables must have a matching to different
+          values, found with augmenting paths, or the constraint fails
+
+        For backjumping, every value removed here is explained by the
+        removals from all of 'variables' made before the call, since the
+        rules only look at the domains in the scope.
+        """
+        self.revisions += 1
+        if assignment.compact:
+            return self.propagate_all_different_bits(assignment, variables)
+
+        explain = self.explanations is not None
+        reason = None
+        reduced = []
+        while True:
+            progress = False
+
+            # naked singles
+            for var in variables:
+                if assignment.size(var) != 1:
+                    continue
+                value = assignment.values_of(var)[0]
+                for other in variables:
+                    if other != var and assignment.contains(other, value):
+                        self.constraint_checks += 1
+                        if explain:
+                            if reason is None:
+                                reason = self.scope_reason(assignment, variables)
+                            self.explanations[(other, value)] = reason
+                        assignment.remove(other, value)
+                        if assignment.size(other) == 0:
+                            return None
+                        reduced.append(other)
+                        progress = True
+
+            # hidden singles
+            places = {}
+            for var in variables:
+                for value in assignment.values_of(var):
+                    places.setdefault(value, []).append(var)
+            if len(places) < len(variables):
+                return None
+            if len(places) == len(variables):
+                for value, vars_with_value in places.items():
+                    if len(vars_with_value) > 1:
+                        continue
+                    var = vars_with_value[0]
+                    if not assignment.contains(var, value):
+                        # var var også eneste plass for en annen verdi
+                        return None
+                    if assignment.size(var) > 1:
+                        if explain:
+                            if reason is None:
+                                reason = self.scope_reason(assignment, variables)
+                            for other_value in assignment.values_of(var):
+                                self.explanations[(var, other_value)] = reason
+                        assignment.assign(var, value)
+                        reduced.append(var)
+                        progress = True
+
+            if not progress:
+                break
+
+        if not self.has_all_different_matching(assignment, variables):
+            return None
+        return reduced
+
+    def propagate_all_different_bits(self, assignment, variables):
+        """The compact version of propagate_all_different(), for bitmask
+        domains. The decided values, and the values that can only go in
+        one place, are found for all of the variables at once with '|'
+        and '&' on the masks.
+        """
+        explain = self.explanations is not None
+        reason = None
+        reduced = []
+        while True:
+            progress = False
+
+            # naked singles
+            singles = 0
+            for var in variables:
+                mask = assignment[var]
+                if mask & (mask - 1) == 0:
+                    if singles & mask:
+                        return None
+                    singles |= mask
+            if singles:
+                for var in variables:
+                    mask = assignment[var]
+                    if mask & singles and mask & (mask - 1):
+                        self.constraint_checks += 1
+                        if explain:
+                            if reason is None:
+                                reason = self.scope_reason(assignment, variables)
+                            self.explain_bits(var, mask & singles, reason)
+                        assignment.remove_bits(var, mask & singles)
+                        if assignment[var] == 0:
+                            return None
+                        reduced.append(var)
+                        progress = True
+
+            # hidden singles: once har alle verdier som finnes, twice de
+            # som finnes i minst to domener
+            once = twice = 0
+            for var in variables:
+                mask = assignment[var]
+                twice |= once & mask
+                once |= mask
+            values = bin(once).count('1')
+            if values < len(variables):
+                return None
+            hidden = once & ~twice
+            if values == len(variables) and hidden:
+                for var in variables:
+                    mask = assignment[var]
+                    bit = mask & hidden
+                    if not bit:
+                        continue
+                    if bit & (bit - 1):
+                        return None
+                    if mask != bit:
+                        if explain:
+                            if reason is None:
+                                reason = self.scope_reason(assignment, variables)
+                            self.explain_bits(var, mask & ~bit, reason)
+                        assignment.remove_bits(var, mask & ~bit)
+                        reduced.append(var)
+                        progress = True
+
+            if not progress:
+                break
+
+        if not self.has_all_different_matching_bits(assignment, variables):
+            return None
+        return reduced
+
+    def has_all_different_matching_bits(self, assignment, variables):
+        """The compact version of has_all_different_matching(), where the
+        values already visited by an augmenting path are a bitmask.
+        """
+        domains = [ assignment[var] for var in variables ]
+        matched = {}
+        visited = [0]
+
+        def augment(k):
+            free = domains[k] & ~visited[0]
+            while free:
+                bit = free & -free
+                free ^= bit
+                self.constraint_checks += 1
+                if visited[0] & bit:
+                    continue
+                visited[0] |= bit
+                if bit not in matched or augment(matched[bit]):
+                    matched[bit] = k
+                    return True
+            return False
+
+        for k in range(len(domains)):
+            visited[0] = 0
+            if not augment(k):
+                return False
+        return True
+
+    def has_all_different_matching(self, assignment, variables):
+        """Check if every variable in 'variables' can get a different value
+        from its domain, by finding a maximum bipartite matching between
+        the variables and the values with augmenting paths.
+        """
+        domains = [ assignment.values_of(var) for var in variables ]
+        matched = {}
+
+        def augment(k, visited):
+            for value in domains[k]:
+                self.constraint_checks += 1
+                if value in visited:
+                    continue
+                visited.add(value)
+                if value not in matched or augment(matched[value], visited):
+                    matched[value] = k
+                    return True
+            return False
+
+        for k in range(len(domains)):
+            if not augment(k, set()):
+                return False
         return True
 
 # -----------------------------------------------------------------------------
@@ -193,29 +1912,117 @@ class CSP:
         'j' specifies the arc that should be visited. If a value is
         found in variable i's domain that doesn't satisfy the constraint
         between i and j, the value should be deleted from i's list of
-        legal values in 'assignment'.
+        legal values in 'assignment', through assignment.remove() so
+        that the deletion can be undone.
         """
 
-        revised = False
+        self.revisions += 1
+        if assignment.compact:
+            return self.revise_bits(assignment, i, j)
+        if self.arc_consistency == 'ac2001':
+            return self.revise_residual(assignment, i, j)
+
+        # x is supported if at least one value in j's domain is in the
+        # support set of x
+        supports = self.constraints[i][j]
+        domain_j = assignment[j]
         not_satisfied = []
-        for x in assignment[i]:  # her sjekker vi riktig arc fra assignment/current partial assignment
-            satisfy = False
-            for y in assignment[j]:
-                # if not x in self.add_constraint_one_way(i,j,filter_function): #x fins innenfor i som ikke tilfredstiller constrainten mellom i og j
-                # vil kanskje ikke adde en constraint, men bare sjekke at parene oppfyller denne constrainten:
-                if (x, y) in self.constraints[i][j]:
-                    satisfy = True
+        checks = 0
+        for x in assignment[i]:
+            supports_x = supports.get(x)
+            for y in domain_j:
+                checks += 1
+                if y in supports_x:
                     break
-                    # vil fjerne denne verdien fra i sine legal_values
-            if not satisfy:
+            else:
                 not_satisfied.append(x)
-                revised = True
+        self.constraint_checks += checks
+        revised = len(not_satisfied) > 0
 
+        if self.explanations is not None:
+            for x in not_satisfied:
+                self.explanations[(i, x)] = self.support_reason(assignment, i, j, x)
         for x in not_satisfied:
-            assignment[i].remove(x)
+            assignment.remove(i, x)
 
         return revised
 
+    def revise_residual(self, assignment, i, j):
+        """The version of revise() used for 'ac2001', which is AC-3 with
+        residual supports rather than AC-2001 proper. The last support
+        found for every value x of i is remembered and checked first.
+        Only if it has been removed from j's domain is j's domain
+        searched again, from the start, for a new support, which then
+        becomes the remembered one. The supports are not restored when
+        the search backtracks, so a remembered support may be stale, but
+        it is only ever used after checking that it is still in j's
+        domain, and the same values are removed as by revise().
+        """
+        supports = self.constraints[i][j]
+        last = self.last_support.setdefault((i, j), {})
+        domain_j = assignment[j]
+        not_satisfied = []
+        checks = 0
+        for x in assignment[i]:
+            if x in last:
+                checks += 1
+                if last[x] in domain_j:
+                    continue
+            supports_x = supports.get(x)
+            for y in domain_j:
+                checks += 1
+                if y in supports_x:
+                    last[x] = y
+                    break
+            else:
+                not_satisfied.append(x)
+        self.constraint_checks += checks
+
+        if self.explanations is not None:
+            for x in not_satisfied:
+                self.explanations[(i, x)] = self.support_reason(assignment, i, j, x)
+        for x in not_satisfied:
+            assignment.remove(i, x)
+
+        return len(not_satisfied) > 0
+
+    def revise_bits(self, assignment, i, j):
+        """The compact version of revise(), for bitmask domains. A value
+        of i is supported if its support mask overlaps the mask of j, so
+        each value costs a single check, and 'ac3' and 'ac2001' are the
+        same here.
+        """
+        supports = self.bit_constraints[i][j]
+        domain_j = assignment[j]
+        not_satisfied = 0
+        mask = assignment[i]
+        while mask:
+            bit = mask & -mask
+            self.constraint_checks += 1
+            if not supports.get(bit, 0) & domain_j:
+                not_satisfied |= bit
+            mask ^= bit
+
+        if not_satisfied:
+            if self.explanations is not None:
+                mask = not_satisfied
+                while mask:
+                    bit = mask & -mask
+                    self.explanations[(i, self.bit_values[bit])] = self.support_reason(assignment, i, j, bit)
+                    mask ^= bit
+            assignment.remove_bits(i, not_satisfied)
+            return True
+        return False
+
+    def explain_bits(self, var, bits, reason):
+        """Record 'reason' as the explanation of every value in the
+        bitmask 'bits' removed from the domain of 'var'.
+        """
+        while bits:
+            bit = bits & -bits
+            self.explanations[(var, self.bit_values[bit])] = reason
+            bits ^= bit
+
 
 # -----------------------------------------------------------------------------
 
@@ -236,74 +2043,548 @@ def create_map_coloring_csp():
             csp.add_constraint_one_way(other_state, state, lambda i, j: i != j)
     return csp
 
-def create_sudoku_csp(filename):
+# Fargene til generate_map_coloring_csp()
+MAP_COLORS = [ 'red', 'green', 'blue', 'yellow', 'purple', 'orange', 'cyan', 'magenta' ]
+
+def generate_map_coloring_csp(regions=100, colors=4, degree=4.0, seed=None):
+    """Generate a random map coloring CSP with 'regions' regions named
+    'R0', 'R1', ..., 'colors' colors and on average 'degree' borders per
+    region. The borders are only drawn between regions of different
+    colors in a hidden random coloring, so the CSP always has a
+    solution. The same 'seed' always gives the same CSP.
+    """
+    if colors > len(MAP_COLORS):
+        raise ValueError('At most %d colors are supported, got %d' % (len(MAP_COLORS), colors))
+    rng = random.Random(seed)
+    names = [ 'R%d' % k for k in range(regions) ]
+    hidden = [ rng.randrange(colors) for _ in names ]
+    borders = set()
+    wanted = min(int(degree * regions / 2), regions * (regions - 1) // 2)
+    while len(borders) < wanted:
+        i, j = rng.sample(range(regions), 2)
+        if hidden[i] != hidden[j]:
+            borders.add((min(i, j), max(i, j)))
+        elif colors == 1:
+            break
+
+    csp = CSP()
+    for name in names:
+        csp.add_variable(name, MAP_COLORS[:colors])
+    for i, j in sorted(borders):
+        csp.add_constraint_one_way(names[i], names[j], lambda x, y: x != y)
+        csp.add_constraint_one_way(names[j], names[i], lambda x, y: x != y)
+    return csp
+
+def create_scheduling_csp(durations, horizon, intensional=True):
+    """Instantiate a CSP that schedules tasks with the given 'durations'
+    one after the other, where the start time of each task is a
+    variable with the integer time slots 0 .. 'horizon' - 1 as domain,
+    and every task must end before the next one starts. With large
+    horizons the constraints should be 'intensional' (see
+    add_constraint_one_way()), as the value pairs of one constraint grow
+    with the square of the horizon.
+    """
+    csp = CSP()
+    tasks = [ 'T%d' % k for k in range(len(durations)) ]
+    for task in tasks:
+        csp.add_variable(task, range(horizon))
+    for k in range(len(tasks) - 1):
+        duration = durations[k]
+        csp.add_constraint_one_way(tasks[k], tasks[k + 1],
+                                   lambda i, j, d=duration: i + d <= j, intensional)
+        csp.add_constraint_one_way(tasks[k + 1], tasks[k],
+                                   lambda i, j, d=duration: j + d <= i, intensional)
+    return csp
+
+# Symbolene som brukes for verdiene på et brett med størrelse opp til 35x35,
+# '0' og '.' er tomme ruter
+SUDOKU_SYMBOLS = '123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+
+def sudoku_box_size(size):
+    """Get the size of the boxes of a 'size' x 'size' Sudoku board, i.e.
+    3 for 9x9, 4 for 16x16 and 5 for 25x25.
+    """
+    box = int(round(math.sqrt(size)))
+    if box * box != size or size > len(SUDOKU_SYMBOLS):
+        raise ValueError('Unsupported Sudoku size: %d' % size)
+    return box
+
+def sudoku_size_of(cells):
+    """Get the size of a Sudoku board with 'cells' cells."""
+    size = int(round(math.sqrt(cells)))
+    if size * size != cells:
+        raise ValueError('A Sudoku puzzle must have a square number of cells, got %d' % cells)
+    sudoku_box_size(size)
+    return size
+
+def create_sudoku_csp(filename, size=9):
     """Instantiate a CSP representing the Sudoku board found in the text
     file named 'filename' in the current directory.
     """
+    puzzles = read_sudoku_puzzles(filename, size)
+    try:
+        puzzle = next(puzzles)
+    finally:
+        # lukker filen
+        puzzles.close()
+    return create_sudoku_csp_from_string(puzzle)
+
+def read_sudoku_puzzles(source, size=9, errors=False):
+    """Read 'size' x 'size' Sudoku puzzles lazily from 'source', which is
+    either a file name or an iterable of lines such as an open file or
+    sys.stdin. This is a generator that yields each puzzle as a string of
+    size * size characters as soon as it has been read, so that large
+    files are never loaded all at once.
+
+    A puzzle is either written on one line, or as one line per row like
+    the example boards. Blank lines are skipped, and '.' is read as an
+    empty cell, like '0'.
+
+    A puzzle with the wrong number of cells or rows raises a ValueError,
+    or if 'errors' is True, the ValueError is yielded in its place and
+    the reading goes on with the next line.
+    """
+    if isinstance(source, basestring):
+        with open(source, 'r') as lines:
+            for puzzle in read_sudoku_puzzles(lines, size, errors):
+                yield puzzle
+        return
+
+    cells = size * size
+    pending = ''
+    for number, line in enumerate(source, 1):
+        line = line.strip().replace('.', '0')
+        if not line:
+            continue
+        if len(line) == size:
+            # én rad av en oppgave over flere linjer
+            pending += line
+            if len(pending) == cells:
+                yield pending
+                pending = ''
+            continue
+
+        if pending:
+            error = ValueError('Before line %d: a Sudoku puzzle must have %d rows, got %d'
+                               % (number, size, len(pending) // size))
+            pending = ''
+            if not errors:
+                raise error
+            yield error
+        if len(line) == cells:
+            yield line
+            continue
+        error = ValueError('Line %d: a Sudoku puzzle must have %d cells, got %d'
+                           % (number, cells, len(line)))
+        if not errors:
+            raise error
+        yield error
+    if pending:
+        error = ValueError('A Sudoku puzzle must have %d rows, got %d at the end of the input'
+                           % (size, len(pending) // size))
+        if not errors:
+            raise error
+        yield error
+
+def create_sudoku_template(size=9, native=None):
+    """Instantiate a CSP with all of the variables and constraints of a
+    'size' x 'size' Sudoku board, where every cell can have every value.
+    Use get_sudoku_template() to get the shared template instead.
+
+    If 'native' is True, the rows, columns and boxes are native Alldiff
+    constraints, otherwise they are expanded into binary constraints.
+    The default is to only expand them for 9x9 boards, as the number of
+    value pairs grows with size ** 4.
+    """
+    box = sudoku_box_size(size)
+    if native is None:
+        native = size > 9
+
     csp = CSP()
-    board = map(lambda x: x.strip(), open(filename, 'r'))
 
-    for row in range(9):
-        for col in range(9):
-            if board[row][col] == '0':
-                csp.add_variable('%d-%d' % (row, col), map(str, range(1, 10)))
-            else:
-                csp.add_variable('%d-%d' % (row, col), [ board[row][col] ])
-
-    for row in range(9):
-        csp.add_all_different_constraint([ '%d-%d' % (row, col) for col in range(9) ])
-    for col in range(9):
-        csp.add_all_different_constraint([ '%d-%d' % (row, col) for row in range(9) ])
-    for box_row in range(3):
-        for box_col in range(3):
+    for row in range(size):
+        for col in range(size):
+            csp.add_variable('%d-%d' % (row, col), SUDOKU_SYMBOLS[:size])
+
+    for row in range(size):
+        csp.add_all_different_constraint([ '%d-%d' % (row, col) for col in range(size) ], native)
+    for col in range(size):
+        csp.add_all_different_constraint([ '%d-%d' % (row, col) for row in range(size) ], native)
+    for box_row in range(box):
+        for box_col in range(box):
             cells = []
-            for row in range(box_row * 3, (box_row + 1) * 3):
-                for col in range(box_col * 3, (box_col + 1) * 3):
+            for row in range(box_row * box, (box_row + 1) * box):
+                for col in range(box_col * box, (box_col + 1) * box):
                     cells.append('%d-%d' % (row, col))
-            csp.add_all_different_constraint(cells)
+            csp.add_all_different_constraint(cells, native)
 
+    csp.freeze()
+    csp.compile_bits()
     return csp
 
+# Sudoku-malene bygges bare én gang per prosess, se get_sudoku_template()
+_sudoku_templates = {}
+
+def get_sudoku_template(size=9, native=None):
+    """Get the Sudoku CSP template of this process for the given size,
+    building it the first time it is needed. All boards of one size have
+    the same constraints, so a board only needs to set the domains of
+    the template, see CSP.instantiate().
+    """
+    if native is None:
+        native = size > 9
+    key = (size, native)
+    if key not in _sudoku_templates:
+        _sudoku_templates[key] = create_sudoku_template(size, native)
+    return _sudoku_templates[key]
+
+def create_sudoku_csp_from_string(puzzle, native=None):
+    """Instantiate a CSP representing the Sudoku board given as a single
+    string of size * size characters, row by row, with '0' or '.' for
+    empty cells. The size of the board is found from the length.
+    """
+    puzzle = puzzle.strip().replace('.', '0')
+    size = sudoku_size_of(len(puzzle))
+    return create_sudoku_csp_from_board([ puzzle[row * size:(row + 1) * size] for row in range(size) ],
+                                        native)
+
+def create_sudoku_csp_from_board(board, native=None):
+    """Instantiate a CSP representing the Sudoku board given as a list of
+    strings, one per row, with '0' for empty cells. Only the domains of
+    the given cells are set, the constraints are shared with the Sudoku
+    template of the same size.
+    """
+    size = len(board)
+    givens = {}
+    for row in range(size):
+        for col in range(size):
+            if board[row][col] != '0':
+                givens['%d-%d' % (row, col)] = [ board[row][col] ]
+    return get_sudoku_template(size, native).instantiate(givens)
+
 def print_sudoku_solution(solution):
     """Convert the representation of a Sudoku solution as returned from
     the method CSP.backtracking_search(), into a human readable
     representation.
     """
-    for row in range(9):
-        for col in range(9):
+    size = sudoku_size_of(len(solution))
+    box = sudoku_box_size(size)
+    separator = '+'.join([ '-' * (2 * box) ] + [ '-' * (2 * box + 1) ] * (box - 2) + [ '-' * (2 * box) ])
+    for row in range(size):
+        for col in range(size):
             print solution['%d-%d' % (row, col)][0],
-            if col == 2 or col == 5:
+            if col % box == box - 1 and col != size - 1:
                 print'|',
         print
-        if row == 2 or row == 5:
-            print '------+-------+------'
-
-
-# csp for hver av de 4 sudoku oppgavene
-sudoku1 = create_sudoku_csp('easy.txt')
-sudoku2 = create_sudoku_csp('medium.txt')
-sudoku3 = create_sudoku_csp('hard.txt')
-sudoku4 = create_sudoku_csp('veryhard.txt')
-
-# søk for hver av brettene
-search1 = sudoku1.backtracking_search()
-search2 = sudoku2.backtracking_search()
-search3 = sudoku3.backtracking_search()
-search4 = sudoku4.backtracking_search()
-
-# printe ut løsningen
-print "Easy board solution:\n"
-print_sudoku_solution(search1)
-print "\n\nMedium board solution:\n"
-print_sudoku_solution(search2)
-print "\n\nHard board solution:\n"
-print_sudoku_solution(search3)
-print "\n\nVery hard board solution:\n"
-print_sudoku_solution(search4)
-
-# printe ut antall ganger BACKTRACK funksjonen ble kalt og feilet
-print "\n\n"
-print 'Antall Backtracks:'
-print 'Easy board: ' + str(sudoku1.backtrack_calls) + ', medium board: ' + str(sudoku2.backtrack_calls) + ', hard board: ' + str(sudoku3.backtrack_calls) + ', very hard board: ' + str(sudoku4.backtrack_calls)
-print 'Antall Failures:'
-print 'Easy board: ' + str(sudoku1.backtrack_fails) + ', medium board: ' + str(sudoku2.backtrack_fails) + ', hard board: ' + str(sudoku3.backtrack_fails) + ', very hard board: ' + str(sudoku4.backtrack_fails)
+        if row % box == box - 1 and row != size - 1:
+            print separator
+
+def sudoku_solution_string(solution):
+    """Convert a Sudoku solution as returned from the method
+    CSP.backtracking_search() into a string of size * size characters.
+    """
+    size = sudoku_size_of(len(solution))
+    return ''.join(solution['%d-%d' % (row, col)][0] for row in range(size) for col in range(size))
+
+def generate_sudoku_puzzle(size=9, blanks=0.5, seed=None):
+    """Generate a random solvable 'size' x 'size' Sudoku puzzle as a
+    string, by shuffling the symbols, rows and columns of a patterned
+    full board, and emptying the fraction 'blanks' of the cells. The
+    puzzle is not guaranteed to have a unique solution, which can be
+    checked with CSP.has_unique_solution(). The same 'seed' always gives
+    the same puzzle.
+    """
+    rng = random.Random(seed)
+    box = sudoku_box_size(size)
+
+    def shuffled(values):
+        values = list(values)
+        rng.shuffle(values)
+        return values
+
+    symbols = shuffled(SUDOKU_SYMBOLS[:size])
+    rows = [ band * box + row for band in shuffled(range(box)) for row in shuffled(range(box)) ]
+    cols = [ stack * box + col for stack in shuffled(range(box)) for col in shuffled(range(box)) ]
+    cells = [ symbols[(box * (row % box) + row // box + col) % size] for row in rows for col in cols ]
+    for cell in rng.sample(range(size * size), int(blanks * size * size)):
+        cells[cell] = '0'
+    return ''.join(cells)
+
+def benchmark_sudoku_sizes(sizes=(9, 16, 25), count=3, blanks=0.45, seed=0):
+    """Print how building and solving generated puzzles scales with the
+    size of the board, for binary Alldiff constraints and for the native
+    Alldiff propagator. Binary constraints are skipped above 16x16,
+    where the pair tables need tens of millions of value pairs.
+    """
+    print 'size  alldiff  build (s)  solve (s)  backtracks  fails  revisions'
+    for size in sizes:
+        puzzles = [ generate_sudoku_puzzle(size, blanks, seed + k) for k in range(count) ]
+        for native in (False, True):
+            if not native and size > 16:
+                continue
+            start = time.time()
+            template = create_sudoku_template(size, native)
+            build = time.time() - start
+
+            solve = 0.0
+            calls = fails = revisions = 0
+            for puzzle in puzzles:
+                givens = dict(('%d-%d' % (k // size, k % size), [ value ])
+                              for k, value in enumerate(puzzle) if value != '0')
+                csp = template.instantiate(givens)
+                start = time.time()
+                if not csp.backtracking_search(compact=True):
+                    raise AssertionError('Generated puzzle has no solution: %s' % puzzle)
+                solve += time.time() - start
+                calls += csp.backtrack_calls
+                fails += csp.backtrack_fails
+                revisions += csp.revisions
+            print '%-5s %-8s %9.3f  %9.3f  %10.1f  %5.1f  %9.1f' % (
+                '%dx%d' % (size, size), 'native' if native else 'binary', build,
+                solve / count, calls / float(count), fails / float(count), revisions / float(count))
+
+def benchmark_backjumping(filenames=('easy.txt', 'medium.txt', 'hard.txt', 'veryhard.txt'),
+                          orderings=('mrv', 'dom/wdeg')):
+    """Print the backtracks, failures and time of chronological
+    backtracking and of conflict-directed backjumping on the boards in
+    'filenames', for each of the variable 'orderings'.
+    """
+    print 'board           ordering  search  backtracks  fails  backjumps  nogoods  time (s)'
+    for filename in filenames:
+        for ordering in orderings:
+            for backjumping in (False, True):
+                csp = create_sudoku_csp(filename)
+                if not csp.backtracking_search(variable_ordering=ordering, backjumping=backjumping):
+                    raise AssertionError('Board has no solution: %s' % filename)
+                stats = csp.search_stats()
+                print '%-15s %-9s %-7s %10d  %5d  %9d  %7d  %8.3f' % (
+                    filename, ordering, 'cbj' if backjumping else 'bt', stats['backtrack_calls'],
+                    stats['backtrack_fails'], stats['backjumps'], stats['nogoods'], stats['seconds'])
+
+def benchmark_min_conflicts(sizes=(100, 1000, 5000), degree=6.0, time_limit=30, seed=0):
+    """Print the time backtracking_search() and min_conflicts() take
+    on generated four color maps of the given 'sizes'. Backtracking is
+    stopped after 'time_limit' seconds.
+    """
+    print 'regions  solver         status         nodes/steps  time (s)'
+    for regions in sizes:
+        csp = generate_map_coloring_csp(regions, 4, degree, seed)
+        csp.backtracking_search(time_limit=time_limit)
+        print '%7d  %-13s  %-13s  %11d  %8.3f' % (
+            regions, 'backtracking', csp.status, csp.backtrack_calls, csp.search_time)
+        csp.min_conflicts(time_limit=time_limit, seed=seed)
+        print '%7d  %-13s  %-13s  %11d  %8.3f' % (
+            regions, 'min-conflicts', csp.status, csp.steps, csp.search_time)
+
+def benchmark_intensional(horizons=(100, 300, 1000), tasks=6, seed=0):
+    """Print the time to build and solve create_scheduling_csp() with
+    extensional and with intensional constraints for growing horizons,
+    and the number of value pairs stored by the constraints: the legal
+    pairs, or the memoised results. Extensional constraints are skipped
+    above a horizon of 300, where they need millions of pairs. The
+    residual supports of 'ac2001' are used, as they check far fewer
+    pairs on these large domains.
+    """
+    rng = random.Random(seed)
+    durations = [ rng.randint(1, 10) for _ in range(tasks) ]
+    print 'horizon  constraints  build (s)  solve (s)  stored pairs'
+    for horizon in horizons:
+        for intensional in (False, True):
+            if not intensional and horizon > 300:
+                continue
+            start = time.time()
+            csp = create_scheduling_csp(durations, horizon, intensional)
+            build = time.time() - start
+            if not csp.backtracking_search(arc_consistency='ac2001'):
+                raise AssertionError('Schedule has no solution: %r' % (durations,))
+            tables = [ table for i in csp.variables for table in csp.constraints[i].values() ]
+            if intensional:
+                stored = sum(len(table.cache) for table in tables)
+            else:
+                stored = sum(len(table) for table in tables)
+            print '%7d  %-11s  %9.3f  %9.3f  %12d' % (
+                horizon, 'intensional' if intensional else 'extensional', build,
+                csp.search_time, stored)
+
+def solve_sudoku_puzzle(numbered_puzzle, **search_options):
+    """Solve one puzzle for solve_sudoku_batch(). 'numbered_puzzle' is a
+    tuple (index, puzzle), and the result is a tuple (index, status,
+    solution, backtrack_calls, backtrack_fails, seconds, error), where
+    'status' is one of
+
+      'solved'      'solution' is the solution as a string
+      'unsolvable'  the puzzle has no solution
+      'limit'       a limit in 'search_options' stopped the search before
+                    it found a solution or showed there is none
+      'error'       the puzzle could not be read, and 'error' is the
+                    message of the ValueError from read_sudoku_puzzles()
+
+    'solution' is None unless the puzzle was solved, and 'error' is None
+    unless it could not be read.
+    """
+    index, puzzle = numbered_puzzle
+    if isinstance(puzzle, ValueError):
+        return index, 'error', None, 0, 0, 0.0, str(puzzle)
+    start = time.time()
+    csp = create_sudoku_csp_from_string(puzzle)
+    solution = csp.backtracking_search(**search_options)
+    if solution:
+        status = 'solved'
+        solution = sudoku_solution_string(solution)
+    else:
+        status = 'limit' if isinstance(solution, PartialSolution) else 'unsolvable'
+        solution = None
+    return (index, status, solution, csp.backtrack_calls, csp.backtrack_fails,
+            time.time() - start, None)
+
+# Hvor mange oppgaver hver arbeider får i køen om gangen i solve_sudoku_batch()
+BATCH_QUEUE_CHUNKS = 4
+
+def solve_sudoku_batch(puzzles, workers=None, chunksize=1, size=9, **search_options):
+    """Solve every 'size' x 'size' puzzle in 'puzzles', a file name or an
+    iterable of lines (e.g. an open file or sys.stdin) read with
+    read_sudoku_puzzles(), spread over a pool of 'workers' processes.
+    The default is one process per CPU, and with workers=1 the puzzles
+    are solved in this process. 'chunksize' is the number of puzzles
+    sent to a worker at a time. Any other keyword arguments are passed
+    on to CSP.backtracking_search().
+
+    This is a generator that yields the results of solve_sudoku_puzzle()
+    as soon as each puzzle is solved, so they can come in a different
+    order than the puzzles. The index in each result is the position of
+    the puzzle in 'puzzles'. A puzzle that can not be read gives a result
+    with status 'error', and the other puzzles are still solved.
+
+    The puzzles are read and handed to the pool a batch of
+    BATCH_QUEUE_CHUNKS chunks per worker at a time, so a large file or
+    an endless stream is never read far ahead of the solved puzzles.
+    """
+    numbered_puzzles = enumerate(read_sudoku_puzzles(puzzles, size, errors=True))
+    solve = functools.partial(solve_sudoku_puzzle, **search_options)
+
+    if workers == 1:
+        for numbered_puzzle in numbered_puzzles:
+            yield solve(numbered_puzzle)
+        return
+
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    batch_size = workers * chunksize * BATCH_QUEUE_CHUNKS
+    pool = multiprocessing.Pool(workers)
+    try:
+        while True:
+            batch = list(itertools.islice(numbered_puzzles, batch_size))
+            if not batch:
+                break
+            for result in pool.imap_unordered(solve, batch, chunksize):
+                yield result
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+def solve_example_boards():
+    """Solve the four example boards and print the solutions and the
+    number of backtracks for each of them.
+    """
+    # csp for hver av de 4 sudoku oppgavene
+    sudoku1 = create_sudoku_csp('easy.txt')
+    sudoku2 = create_sudoku_csp('medium.txt')
+    sudoku3 = create_sudoku_csp('hard.txt')
+    sudoku4 = create_sudoku_csp('veryhard.txt')
+
+    # søk for hver av brettene
+    search1 = sudoku1.backtracking_search()
+    search2 = sudoku2.backtracking_search()
+    search3 = sudoku3.backtracking_search()
+    search4 = sudoku4.backtracking_search()
+
+    # printe ut løsningen
+    print "Easy board solution:\n"
+    print_sudoku_solution(search1)
+    print "\n\nMedium board solution:\n"
+    print_sudoku_solution(search2)
+    print "\n\nHard board solution:\n"
+    print_sudoku_solution(search3)
+    print "\n\nVery hard board solution:\n"
+    print_sudoku_solution(search4)
+
+    # printe ut antall ganger BACKTRACK funksjonen ble kalt og feilet
+    print "\n\n"
+    print 'Antall Backtracks:'
+    print 'Easy board: ' + str(sudoku1.backtrack_calls) + ', medium board: ' + str(sudoku2.backtrack_calls) + ', hard board: ' + str(sudoku3.backtrack_calls) + ', very hard board: ' + str(sudoku4.backtrack_calls)
+    print 'Antall Failures:'
+    print 'Easy board: ' + str(sudoku1.backtrack_fails) + ', medium board: ' + str(sudoku2.backtrack_fails) + ', hard board: ' + str(sudoku3.backtrack_fails) + ', very hard board: ' + str(sudoku4.backtrack_fails)
+    print 'Antall Revisjoner:'
+    print 'Easy board: ' + str(sudoku1.revisions) + ', medium board: ' + str(sudoku2.revisions) + ', hard board: ' + str(sudoku3.revisions) + ', very hard board: ' + str(sudoku4.revisions)
+    print 'Antall Constraint checks:'
+    print 'Easy board: ' + str(sudoku1.constraint_checks) + ', medium board: ' + str(sudoku2.constraint_checks) + ', hard board: ' + str(sudoku3.constraint_checks) + ', very hard board: ' + str(sudoku4.constraint_checks)
+
+def main(argv=None):
+    """Solve the puzzles in the file given on the command line, printing
+    one tab separated line per puzzle as soon as it is solved, or solve
+    the four example boards if no file is given.
+    """
+    parser = argparse.ArgumentParser(description='Solve Sudoku boards with the CSP solver.')
+    parser.add_argument('puzzles', nargs='?',
+                        help='file with one puzzle per line, or - for stdin. '
+                             'Without it, the four example boards are solved.')
+    parser.add_argument('-s', '--size', type=int, default=9,
+                        help='size of the boards, e.g. 9, 16 or 25 (default: 9)')
+    parser.add_argument('--scaling', action='store_true',
+                        help='benchmark generated boards from 9x9 to 25x25 instead')
+    parser.add_argument('--intensional', action='store_true',
+                        help='compare intensional and extensional constraints '
+                             'on schedules with large domains instead')
+    parser.add_argument('--min-conflicts', action='store_true',
+                        help='compare min-conflicts with backtracking on generated maps instead')
+    parser.add_argument('--backjumping', action='store_true',
+                        help='search with conflict-directed backjumping')
+    parser.add_argument('--compare-backjumping', action='store_true',
+                        help='compare backjumping with chronological backtracking '
+                             'on the example boards instead')
+    parser.add_argument('-w', '--workers', type=int, default=None,
+                        help='number of worker processes (default: one per CPU)')
+    parser.add_argument('-c', '--chunksize', type=int, default=1,
+                        help='number of puzzles sent to a worker at a time')
+    args = parser.parse_args(argv)
+
+    if args.scaling:
+        benchmark_sudoku_sizes()
+        return
+
+    if args.compare_backjumping:
+        benchmark_backjumping()
+        return
+
+    if args.min_conflicts:
+        benchmark_min_conflicts()
+        return
+
+    if args.intensional:
+        benchmark_intensional()
+        return
+
+    if args.puzzles is None:
+        solve_example_boards()
+        return
+
+    if args.puzzles == '-':
+        puzzles = sys.stdin
+    else:
+        puzzles = args.puzzles
+
+    # index, status, løsning, antall backtracks, antall failures, sekunder
+    for index, status, solution, calls, fails, seconds, error in solve_sudoku_batch(
+            puzzles, workers=args.workers, chunksize=args.chunksize, size=args.size,
+            backjumping=args.backjumping):
+        if status == 'error':
+            print '%d\terror\t%s' % (index, error)
+        else:
+            print '%d\t%s\t%s\t%d\t%d\t%.4f' % (
+                index, status, solution or '-', calls, fails, seconds)
+        sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
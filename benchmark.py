@@ -0,0 +1,462 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+"""
+Benchmarks of the CSP solver (assignment5.py) and the adversarial search
+agents (Assignment4.py) on a fixed, seeded corpus:
+
+  sudoku/...  the four example boards and generated 9x9 and 16x16 puzzles,
+              with each of the solver configurations in SUDOKU_CONFIGS
+  map/...     generated four color maps, with backtracking, backjumping and
+              min-conflicts
+  pacman/...  game states sampled from Pacman layouts, with each of the
+              agents in PACMAN_AGENTS at each of PACMAN_DEPTHS
+
+Every case is run --repeat times, each time in a new process so that its
+peak memory can be measured, and the fastest run is kept. The report is a
+JSON file with the wall time, the growth of the peak memory (KB) and the
+counters of instrumentation.SearchRecord for every case: for the CSP the
+nodes are the backtrack calls and the prunings the failed ones, for the
+agents the nodes and prunings are summed over the moves. The rest of a
+case, the counters and the solution or moves, is the same on every run,
+so any difference from a saved baseline is a change in the search:
+
+    python benchmark.py -o baseline.json
+    python benchmark.py -b baseline.json -o report.json
+
+The Pacman cases need the layout and pacman modules of the Pacman project,
+and are skipped without them.
+"""
+
+import argparse
+import hashlib
+import json
+import multiprocessing
+import platform
+import sys
+import time
+import traceback
+from collections import OrderedDict
+
+import assignment5
+from instrumentation import COUNTERS, Instrumentation
+
+try:
+    import Assignment4
+except ImportError:
+    Assignment4 = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Version of the report format
+REPORT_FORMAT = 1
+
+SEED = 0
+
+# The example boards of the assignment, by difficulty
+SUDOKU_BOARDS = [
+    ('easy', '003020600900305001001806400008102900700000008006708200002609500800203009005010300'),
+    ('medium', '200080300060070084030500209000105408000000000402706000301007040720040060004010003'),
+    ('hard', '400000805030000000000700000020000060000080400000010000000603070500200000104000000'),
+    ('veryhard', '800000000003600000070090200050007000000045700000100030001000068008500010090000400'),
+]
+
+# Generated puzzles: size, fraction of blank cells and number of puzzles
+SUDOKU_GENERATED = [(9, 0.7, 3), (16, 0.6, 1)]
+
+# Options to CSP.backtracking_search()
+SUDOKU_CONFIGS = [
+    ('mrv', {}),
+    ('compact', dict(compact=True)),
+    ('ac2001', dict(arc_consistency='ac2001')),
+    ('lcv', dict(value_ordering='lcv')),
+    ('domwdeg', dict(variable_ordering='dom/wdeg')),
+    ('cbj', dict(variable_ordering='dom/wdeg', backjumping=True)),
+]
+
+# Generated maps: regions and average number of borders per region
+MAP_SIZES = [(100, 6.0), (1000, 6.0)]
+
+# The solver ('backtracking' or 'min_conflicts') and its options. The
+# limits keep the cases short, and unlike a time limit they stop the
+# search at the same point on every run.
+MAP_CONFIGS = [
+    ('mrv', 'backtracking', dict(node_limit=100000)),
+    ('cbj', 'backtracking', dict(variable_ordering='dom/wdeg', backjumping=True, node_limit=100000)),
+    ('minconflicts', 'min_conflicts', dict(max_steps=100000, seed=SEED)),
+]
+
+PACMAN_LAYOUTS = ['minimaxClassic', 'testClassic', 'smallClassic']
+PACMAN_STATES = 3
+PACMAN_DEPTHS = [2, 3]
+
+# Agent class name and the -a options of the agent
+PACMAN_AGENTS = [
+    ('minimax', 'MinimaxAgent', {}),
+    ('alphabeta', 'AlphaBetaAgent', {}),
+    ('alphabeta-tt', 'AlphaBetaAgent', dict(tableSize='100000', ordering='static,killers,history', pvs='1')),
+    ('expectimax', 'ExpectimaxAgent', {}),
+]
+
+# Fields of a case that are measured, and vary between runs
+MEASURED = ('seconds', 'peak_memory_kb', 'phases')
+
+
+def build_corpus(suites=('sudoku', 'map', 'pacman')):
+    """
+      Returns an OrderedDict from the name of every case in 'suites' to a
+      pair of functions: setup() builds the workload, and run(workload)
+      searches it and returns the counters and result of the case.
+    """
+    cases = OrderedDict()
+    if 'sudoku' in suites:
+        boards = list(SUDOKU_BOARDS)
+        for size, blanks, count in SUDOKU_GENERATED:
+            for k in range(count):
+                boards.append(('generated%d-%d' % (size, k),
+                               assignment5.generate_sudoku_puzzle(size, blanks, seed=SEED + k)))
+        for board, puzzle in boards:
+            for config, options in SUDOKU_CONFIGS:
+                cases['sudoku/%s/%s' % (board, config)] = (
+                    SudokuSetup(puzzle), CSPRun('backtracking', options))
+
+    if 'map' in suites:
+        for regions, degree in MAP_SIZES:
+            for config, solver, options in MAP_CONFIGS:
+                cases['map/%d/%s' % (regions, config)] = (
+                    MapSetup(regions, degree), CSPRun(solver, options))
+
+    if 'pacman' in suites and Assignment4 is not None:
+        for layoutName in PACMAN_LAYOUTS:
+            for depth in PACMAN_DEPTHS:
+                for config, agentType, options in PACMAN_AGENTS:
+                    cases['pacman/%s/%s/depth%d' % (layoutName, config, depth)] = (
+                        PacmanSetup(layoutName, agentType, depth, options), PacmanRun())
+    return cases
+
+
+class SudokuSetup:
+    def __init__(self, puzzle):
+        self.puzzle = puzzle
+
+    def __call__(self):
+        # 16x16 and larger boards use the native Alldiff propagator
+        return assignment5.create_sudoku_csp_from_string(self.puzzle, native=len(self.puzzle) > 81)
+
+
+class MapSetup:
+    def __init__(self, regions, degree):
+        self.regions = regions
+        self.degree = degree
+
+    def __call__(self):
+        return assignment5.generate_map_coloring_csp(self.regions, 4, self.degree, SEED)
+
+
+class CSPRun:
+    """Solves a CSP with 'solver' and the search 'options'."""
+
+    def __init__(self, solver, options):
+        self.solver = solver
+        self.options = options
+
+    def __call__(self, csp):
+        csp.instrumentation = Instrumentation()
+        if self.solver == 'min_conflicts':
+            solution = csp.min_conflicts(**self.options)
+        else:
+            solution = csp.backtracking_search(**self.options)
+        record = csp.instrumentation.last
+
+        result = dict(record.counters)
+        result.update(status=csp.status, backjumps=csp.backjumps, steps=csp.steps,
+                      restarts=csp.restarts, phases=record.phases, solution=solution_digest(solution))
+        return result
+
+
+class PacmanSetup:
+    def __init__(self, layoutName, agentType, depth, options):
+        self.layoutName = layoutName
+        self.agentType = agentType
+        self.depth = depth
+        self.options = options
+
+    def __call__(self):
+        states = Assignment4.sample_states(self.layoutName, PACMAN_STATES, SEED)
+        agent = getattr(Assignment4, self.agentType)(depth=str(self.depth), **self.options)
+        return agent, states
+
+
+class PacmanRun:
+    """Picks a move from each of the states, and sums the records of the moves."""
+
+    def __call__(self, workload):
+        agent, states = workload
+        records = []
+        agent.instrumentation = Instrumentation(hooks=[
+            lambda event, record: event == 'finish' and records.append(record)])
+        moves = [ agent.getAction(gameState) for gameState in states ]
+
+        result = dict((name, sum(record.counters[name] for record in records)) for name in COUNTERS)
+        phases = {}
+        for record in records:
+            for phase, seconds in record.phases.items():
+                phases[phase] = phases.get(phase, 0.0) + seconds
+        result.update(phases=phases, moves=moves)
+        return result
+
+
+def solution_digest(solution):
+    """
+      Returns a short hash of the values of a solution, or None if there
+      is no solution, so that reports show when a search finds another one.
+    """
+    if not solution:
+        return None
+    values = sorted((var, list(values)) for var, values in solution.items())
+    return hashlib.sha1(repr(values).encode('utf-8')).hexdigest()[:16]
+
+
+def peak_memory():
+    """Returns the peak resident memory of this process in KB, or None."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        # bytes on macOS, KB on Linux
+        peak //= 1024
+    return peak
+
+
+def run_case(name, suites):
+    """
+      Runs the case 'name' once and returns its result with the seconds
+      spent searching, and how much the peak memory grew while building
+      and searching the workload.
+    """
+    setup, run = build_corpus(suites)[name]
+    before = peak_memory()
+    workload = setup()
+    start = time.time()
+    result = run(workload)
+    result['seconds'] = time.time() - start
+    after = peak_memory()
+    result['peak_memory_kb'] = after - before if before is not None else None
+    return result
+
+
+def run_case_worker(name, suites, connection):
+    try:
+        connection.send(('ok', run_case(name, suites)))
+    except Exception:
+        connection.send(('error', traceback.format_exc()))
+    connection.close()
+
+
+def run_case_isolated(name, suites):
+    """
+      Runs the case 'name' in a new process, so that the peak memory is
+      that of the case alone.
+    """
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.Process(target=run_case_worker, args=(name, suites, sender))
+    process.start()
+    sender.close()
+    try:
+        status, result = receiver.recv()
+    except EOFError:
+        status, result = 'error', 'Process exited with code %s' % process.exitcode
+    process.join()
+    if status == 'error':
+        raise RuntimeError('Case %s failed:\n%s' % (name, result))
+    return result
+
+
+def measure_case(name, suites, repeat=3, isolate=True):
+    """
+      Runs the case 'name' 'repeat' times and keeps the fastest run and the
+      smallest memory growth. Every run has to give the same counters and
+      result. Without 'isolate' all cases share this process, and the
+      memory can not be measured.
+    """
+    best = None
+    for _ in range(repeat):
+        if isolate:
+            result = run_case_isolated(name, suites)
+        else:
+            result = run_case(name, suites)
+            result['peak_memory_kb'] = None
+        if best is None:
+            best = result
+            continue
+        if deterministic_fields(result) != deterministic_fields(best):
+            raise AssertionError('Case %s gave different results on different runs' % name)
+        best['seconds'] = min(best['seconds'], result['seconds'])
+        if result['peak_memory_kb'] is not None:
+            best['peak_memory_kb'] = min(best['peak_memory_kb'], result['peak_memory_kb'])
+        if result['seconds'] == best['seconds']:
+            best['phases'] = result['phases']
+    return best
+
+
+def deterministic_fields(result):
+    return dict((key, value) for key, value in result.items() if key not in MEASURED)
+
+
+def run_benchmarks(suites=('sudoku', 'map', 'pacman'), pattern=None, repeat=3, isolate=True, verbose=True):
+    """
+      Runs every case in 'suites' whose name contains 'pattern', and
+      returns the report as a dictionary.
+    """
+    names = [ name for name in build_corpus(suites) if pattern is None or pattern in name ]
+    if 'pacman' in suites and Assignment4 is None and verbose:
+        print 'Skipping the pacman cases: the Pacman project modules are missing'
+
+    report = {
+        'format': REPORT_FORMAT,
+        'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'repeat': repeat,
+        'isolated': isolate,
+        'cases': {},
+    }
+    if verbose:
+        print '%-44s %9s %10s %10s %10s  %s' % ('case', 'time (s)', 'memory kB', 'nodes', 'prunings', 'result')
+    for name in names:
+        result = measure_case(name, suites, repeat, isolate)
+        report['cases'][name] = result
+        if verbose:
+            print '%-44s %9.3f %10s %10d %10d  %s' % (
+                name, result['seconds'], format_memory(result['peak_memory_kb']), result['nodes'],
+                result['prunings'], result.get('status') or ' '.join(result.get('moves', ())))
+            sys.stdout.flush()
+    return report
+
+
+def format_memory(kb):
+    return '-' if kb is None else str(kb)
+
+
+def compare_reports(baseline, current, time_tolerance=0.25, memory_tolerance=0.25,
+                    min_seconds=0.05, min_memory_kb=1024):
+    """
+      Compares the report 'current' with the report 'baseline', and returns
+      the regressions as a list of (case, kind, message), where kind is
+
+        'changed'  a counter or the result of the case is different
+        'slower'   the case is more than 'time_tolerance' (a fraction) and
+                   'min_seconds' slower
+        'memory'   the peak memory grew more than 'memory_tolerance' and
+                   'min_memory_kb' more
+        'missing'  the case is in the baseline but was not run
+
+      Cases that are only in 'current' are new, and not regressions.
+    """
+    regressions = []
+    for name in sorted(baseline['cases']):
+        old = baseline['cases'][name]
+        new = current['cases'].get(name)
+        if new is None:
+            regressions.append((name, 'missing', 'not in the report'))
+            continue
+
+        old_fields, new_fields = deterministic_fields(old), deterministic_fields(new)
+        for key in sorted(set(old_fields) | set(new_fields)):
+            if old_fields.get(key) != new_fields.get(key):
+                regressions.append((name, 'changed', '%s: %r -> %r' % (key, old_fields.get(key),
+                                                                       new_fields.get(key))))
+
+        old_seconds, new_seconds = float(old['seconds']), float(new['seconds'])
+        if (new_seconds > old_seconds * (1 + time_tolerance) and
+                new_seconds - old_seconds > min_seconds):
+            message = '%.3f s -> %.3f s' % (old_seconds, new_seconds)
+            # a case that took (next to) no time in the baseline has no
+            # meaningful relative slowdown
+            if old_seconds > 0 and old_seconds >= min_seconds:
+                message += ' (%+.0f%%)' % (100 * (new_seconds / old_seconds - 1))
+            regressions.append((name, 'slower', message))
+
+        old_kb, new_kb = old['peak_memory_kb'], new['peak_memory_kb']
+        if (old_kb is not None and new_kb is not None and new_kb > old_kb * (1 + memory_tolerance) and
+                new_kb - old_kb > min_memory_kb):
+            regressions.append((name, 'memory', '%d kB -> %d kB' % (old_kb, new_kb)))
+    return regressions
+
+
+def print_regressions(baseline, current, regressions):
+    if (baseline['python'], baseline['platform']) != (current['python'], current['platform']):
+        print 'Note: the baseline is from Python %s on %s, so the times may not compare' % (
+            baseline['python'], baseline['platform'])
+    if not regressions:
+        print 'No regressions in %d cases' % len(baseline['cases'])
+        return
+    print '%d regressions:' % len(regressions)
+    for name, kind, message in regressions:
+        print '%-44s %-8s %s' % (name, kind, message)
+
+
+def load_report(filename):
+    with open(filename) as f:
+        report = json.load(f)
+    if report.get('format') != REPORT_FORMAT:
+        raise ValueError('Unknown report format in %s: %r' % (filename, report.get('format')))
+    return report
+
+
+def write_report(report, filename):
+    with open(filename, 'w') as f:
+        json.dump(report, f, indent=1, sort_keys=True, separators=(',', ': '))
+        f.write('\n')
+
+
+def main(argv=None):
+    """
+      Runs the benchmarks and writes the report, and compares it with a
+      baseline if one is given. The exit status is 1 if there are
+      regressions.
+    """
+    parser = argparse.ArgumentParser(description='Benchmark the CSP solver and the Pacman search agents.')
+    parser.add_argument('-o', '--output', default='benchmark.json',
+                        help='file to write the report to (default: benchmark.json)')
+    parser.add_argument('-b', '--baseline',
+                        help='saved report to compare the new report with')
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'REPORT'),
+                        help='compare two saved reports instead of running the benchmarks')
+    parser.add_argument('-s', '--suites', default='sudoku,map,pacman',
+                        help='comma separated suites to run (default: sudoku,map,pacman)')
+    parser.add_argument('-k', '--pattern',
+                        help='only run the cases whose name contains PATTERN')
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help='runs of every case, the fastest is kept (default: 3)')
+    parser.add_argument('--no-isolate', action='store_true',
+                        help='run the cases in this process; faster, but without the memory')
+    parser.add_argument('-t', '--tolerance', type=float, default=0.25,
+                        help='fraction a case may be slower or use more memory than '
+                             'the baseline before it is flagged (default: 0.25)')
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        baseline, current = load_report(args.compare[0]), load_report(args.compare[1])
+    else:
+        baseline = load_report(args.baseline) if args.baseline else None
+        suites = tuple(suite for suite in args.suites.split(',') if suite)
+        current = run_benchmarks(suites, args.pattern, args.repeat, not args.no_isolate)
+        write_report(current, args.output)
+        print 'Report written to %s' % args.output
+        if baseline is None:
+            return 0
+        # Only the cases that were run can be compared
+        baseline['cases'] = dict((name, case) for name, case in baseline['cases'].items()
+                                 if name.split('/')[0] in suites and
+                                 (args.pattern is None or args.pattern in name))
+
+    regressions = compare_reports(baseline, current, args.tolerance, args.tolerance)
+    print_regressions(baseline, current, regressions)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,131 @@
+# -*- coding: UTF-8 -*-
+"""
+Instrumentation shared by the Pacman search agents (Assignment4.py) and the
+CSP solver (assignment5.py).
+
+Every search, one move of an agent or one solve of a CSP, gets a
+SearchRecord with the same counters, the time spent in each phase of the
+search, and some information about the search itself. The records are
+passed to the hooks of an Instrumentation and written to a file as JSON
+lines, one line per search, e.g. for a dashboard.
+
+Nothing is recorded unless an Instrumentation is given to the agent or the
+CSP: the searches keep their own counters anyway, and they are only read
+once a search is done.
+"""
+
+import json
+import time
+
+# The counters of every SearchRecord
+COUNTERS = ('nodes', 'successors', 'evaluations', 'prunings', 'revisions', 'cache_hits')
+
+
+class SearchRecord(object):
+    """
+      The counters, phase timers and information of one search. 'kind' is
+      what was searched ('move' or 'solve'), and 'info' other fields to
+      write with the record, e.g. the agent and the depth.
+    """
+
+    def __init__(self, kind, seq, info):
+        self.kind = kind
+        self.seq = seq
+        self.info = info
+        self.counters = dict((name, 0) for name in COUNTERS)
+        self.phases = {}
+        self.last_phase = None
+        self.started = time.time()
+        self.seconds = 0.0
+
+    def count(self, name, n=1):
+        self.counters[name] += n
+
+    def add_time(self, phase, seconds):
+        """Adds 'seconds' to the timer of 'phase'."""
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+        self.last_phase = phase
+
+    def as_dict(self):
+        record = {'kind': self.kind, 'seq': self.seq, 'started': self.started,
+                  'seconds': self.seconds, 'phases': self.phases}
+        record.update(self.counters)
+        record.update(self.info)
+        return record
+
+
+class CountingCall(object):
+    """
+      Calls 'function' and counts every call in the counter 'name' of
+      'record'. Used to count the calls of a function only while a search
+      is recorded, so that nothing is counted otherwise.
+    """
+
+    def __init__(self, function, record, name):
+        self.function = function
+        self.record = record
+        self.name = name
+
+    def __call__(self, *args):
+        self.record.counters[self.name] += 1
+        return self.function(*args)
+
+
+class Instrumentation(object):
+    """
+      Collects a SearchRecord for every search. 'output' is a file name, to
+      which a JSON line is appended for every record, or an object with a
+      write() method, or None. 'hooks' are functions called as
+      hook(event, record) when a search starts ('start'), when a phase of it
+      ends ('phase', the phase is record.last_phase) and when it is done
+      ('finish').
+    """
+
+    def __init__(self, output=None, hooks=()):
+        self.output = output
+        self.stream = None
+        self.hooks = list(hooks)
+        self.seq = 0
+        self.last = None
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+
+    def start(self, kind, **info):
+        """Returns a new SearchRecord for a search that starts now."""
+        self.seq += 1
+        record = SearchRecord(kind, self.seq, info)
+        self.call_hooks('start', record)
+        return record
+
+    def phase(self, record, phase, seconds):
+        """Adds 'seconds' to the timer of 'phase' in 'record'."""
+        record.add_time(phase, seconds)
+        self.call_hooks('phase', record)
+
+    def finish(self, record, **info):
+        """Ends the search of 'record', and writes it out."""
+        record.seconds = time.time() - record.started
+        record.info.update(info)
+        self.last = record
+        self.call_hooks('finish', record)
+        if self.output is not None:
+            self.write(record)
+
+    def call_hooks(self, event, record):
+        for hook in self.hooks:
+            hook(event, record)
+
+    def write(self, record):
+        if self.stream is None:
+            if hasattr(self.output, 'write'):
+                self.stream = self.output
+            else:
+                self.stream = open(self.output, 'a')
+        self.stream.write(json.dumps(record.as_dict(), sort_keys=True) + '\n')
+        self.stream.flush()
+
+    def close(self):
+        if self.stream is not None and self.stream is not self.output:
+            self.stream.close()
+        self.stream = None
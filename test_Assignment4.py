@@ -0,0 +1,168 @@
+# -*- coding: UTF-8 -*-
+"""
+Tests of the search agents in Assignment4.py. They need the game, layout,
+pacman and util modules of the Pacman project, and are skipped without
+them. Run with python -m unittest test_Assignment4
+"""
+
+import random
+import unittest
+
+try:
+    import layout, pacman
+    import Assignment4
+except ImportError:
+    Assignment4 = None
+
+
+def make_state(lines):
+    gameState = pacman.GameState()
+    gameState.initialize(layout.Layout(lines), 1000)
+    return gameState
+
+
+@unittest.skipIf(Assignment4 is None, 'needs the Pacman project modules')
+class MoveOrderingTest(unittest.TestCase):
+
+    def test_static_order_moves_towards_food_first(self):
+        gameState = make_state(['%%%%%%%%%',
+                                '%G  P  .%',
+                                '%%%%%%%%%'])
+        agent = Assignment4.AlphaBetaAgent(ordering='static')
+        self.assertEqual(agent.static_order(gameState, 0, ['West', 'Stop', 'East']),
+                         ['East', 'Stop', 'West'])
+
+    def test_static_order_moves_away_from_ghosts_first(self):
+        gameState = make_state(['%%%%%%%%%',
+                                '%.  PG  %',
+                                '%%%%%%%%%'])
+        agent = Assignment4.AlphaBetaAgent(ordering='static')
+        self.assertEqual(agent.static_order(gameState, 0, ['East', 'Stop', 'West']),
+                         ['West', 'Stop', 'East'])
+
+
+MINIMAX_CLASSIC = ['%%%%%%%%%',
+                   '%.P    G%',
+                   '% %.%G%%%',
+                   '%G    %%%',
+                   '%%%%%%%%%']
+
+
+CAPSULE_CLASSIC = ['%%%%%%%%%%',
+                   '%o.. G  .%',
+                   '%.%%.%%%.%',
+                   '%..P  G o%',
+                   '%%%%%%%%%%']
+
+
+def describe(gameState):
+    # everything the search sees of a state
+    agents = [gameState.getPacmanState()] + gameState.getGhostStates()
+    return ([(agent.getPosition(), agent.getDirection(), agent.scaredTimer) for agent in agents],
+            sorted(gameState.getFood().asList()), sorted(gameState.getCapsules()),
+            gameState.getScore(), gameState.isWin(), gameState.isLose(),
+            [sorted(gameState.getLegalActions(index)) for index in range(gameState.getNumAgents())])
+
+
+@unittest.skipIf(Assignment4 is None, 'needs the Pacman project modules')
+class SearchStateTest(unittest.TestCase):
+
+    def test_make_and_unmake_follow_the_game(self):
+        # Random walks down and back up the game tree, where every move is
+        # made on a SearchState and with GameState.generateSuccessor
+        rng = random.Random(17)
+        for lines in (CAPSULE_CLASSIC, MINIMAX_CLASSIC):
+            for walk in range(20):
+                gameStates = [make_state(lines)]
+                state = Assignment4.SearchState(gameStates[0])
+                agentIndex = 0
+                for step in range(200):
+                    gameState = gameStates[-1]
+                    legal_moves = gameState.getLegalActions(agentIndex)
+                    if len(gameStates) > 1 and (not legal_moves or rng.random() < 0.2):
+                        gameStates.pop()
+                        state.unmake()
+                        agentIndex = (agentIndex - 1) % gameState.getNumAgents()
+                    elif not legal_moves:
+                        break
+                    else:
+                        move = rng.choice(legal_moves)
+                        gameStates.append(gameState.generateSuccessor(agentIndex, move))
+                        state.make(agentIndex, move)
+                        agentIndex = (agentIndex + 1) % gameState.getNumAgents()
+                    self.assertEqual(describe(state), describe(gameStates[-1]))
+                    self.assertEqual(len(state.trail), len(gameStates) - 1)
+
+
+@unittest.skipIf(Assignment4 is None, 'needs the Pacman project modules')
+class PrincipalVariationSearchTest(unittest.TestCase):
+
+    def make_agent(self, **options):
+        windows = []
+
+        class WindowAgent(Assignment4.AlphaBetaAgent):
+            # the windows of the searches of the root moves, where the first
+            # ghost moves after Pacman at depth 0
+            def value(self, gameState, agentIndex, a, b, depth):
+                if agentIndex == 1 and depth == 0:
+                    windows.append(b - a)
+                return Assignment4.AlphaBetaAgent.value(self, gameState, agentIndex, a, b, depth)
+
+        return WindowAgent(**options), windows
+
+    def test_null_window_searches_at_the_root(self):
+        gameState = make_state(MINIMAX_CLASSIC)
+        agent, windows = self.make_agent(depth='3', pvs='1')
+        move = agent.getAction(gameState)
+        self.assertEqual(move, Assignment4.AlphaBetaAgent(depth='3').getAction(gameState))
+        root_moves = len(gameState.getLegalActions(0))
+        self.assertTrue(root_moves > 1)
+        # the first move with the full window, every other one with a null
+        # window first
+        self.assertEqual(windows[0], float('inf'))
+        self.assertEqual(windows.count(Assignment4.NULL_WINDOW), root_moves - 1)
+
+    def test_no_null_windows_without_pvs(self):
+        agent, windows = self.make_agent(depth='3')
+        agent.getAction(make_state(MINIMAX_CLASSIC))
+        self.assertEqual(windows.count(Assignment4.NULL_WINDOW), 0)
+
+
+@unittest.skipIf(Assignment4 is None, 'needs the Pacman project modules')
+class TranspositionTableTest(unittest.TestCase):
+
+    def test_deepening_goes_on_with_values_from_the_table(self):
+        # The values found by a search to depth 1 are in the table when the
+        # deepening searches to depth 1, and must still tell that they were
+        # cut off at the depth limit, or the deepening stops there
+        gameState = make_state(MINIMAX_CLASSIC)
+        for agent_class in (Assignment4.MinimaxAgent, Assignment4.AlphaBetaAgent,
+                            Assignment4.ExpectimaxAgent):
+            name = agent_class.__name__
+            agent = agent_class(depth='1', tableSize='100000')
+            agent.getAction(gameState)
+            deepening = agent_class(tableSize='100000', timeLimit='100')
+            deepening.table = agent.table
+            deepening.getAction(gameState)
+            first = deepening.search_depth
+            self.assertTrue(first > 1, '%s: stopped at depth %d' % (name, first))
+            deepening.getAction(gameState)
+            self.assertTrue(deepening.search_depth >= first,
+                            '%s: depth %d after %d' % (name, deepening.search_depth, first))
+
+@unittest.skipIf(Assignment4 is None, 'needs the Pacman project modules')
+class ParallelSearchTest(unittest.TestCase):
+
+    def test_parallel_search_picks_the_serial_move_with_ordering(self):
+        states = Assignment4.sample_states('testClassic', 4, 23)
+        serial = Assignment4.AlphaBetaAgent(depth='3', ordering='static')
+        parallel = Assignment4.AlphaBetaAgent(depth='3', ordering='static', workers='2')
+        try:
+            for gameState in states:
+                self.assertEqual(parallel.getAction(gameState), serial.getAction(gameState))
+        finally:
+            parallel.close_pool()
+
+
+if __name__ == '__main__':
+    unittest.main()
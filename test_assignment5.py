@@ -0,0 +1,263 @@
+# -*- coding: UTF-8 -*-
+"""
+Tests of the CSP solver in assignment5.py. Run with
+python -m unittest test_assignment5
+"""
+
+import random
+import unittest
+
+import assignment5
+
+EASY = '003020600900305001001806400008102900700000008006708200002609500800203009005010300'
+MEDIUM = '200080300060070084030500209000105408000000000402706000301007040720040060004010003'
+VERYHARD = '800000000003600000070090200050007000000045700000100030001000068008500010090000400'
+
+
+def random_binary_csp(seed, variables=16, values=4, density=0.3, tightness=0.4,
+                      all_different=None, **constraint_options):
+    """A random CSP where each pair of variables is constrained with
+    probability 'density', and each constraint forbids a share
+    'tightness' of the value pairs. 'all_different' is the number of
+    variables in an extra native Alldiff constraint.
+    """
+    rng = random.Random(seed)
+    csp = assignment5.CSP()
+    names = [ 'X%d' % k for k in range(variables) ]
+    for name in names:
+        csp.add_variable(name, range(values))
+    for k, i in enumerate(names):
+        for j in names[k + 1:]:
+            if rng.random() < density:
+                forbidden = set((x, y) for x in range(values) for y in range(values)
+                                if rng.random() < tightness)
+                csp.add_constraint_one_way(i, j, lambda x, y, f=forbidden: (x, y) not in f,
+                                           **constraint_options)
+                csp.add_constraint_one_way(j, i, lambda x, y, f=forbidden: (y, x) not in f,
+                                           **constraint_options)
+    if all_different:
+        csp.add_all_different_constraint(rng.sample(names, all_different), native=True)
+    return csp
+
+
+class SearchLimitTest(unittest.TestCase):
+
+    def test_node_limit_counts_from_the_start_of_each_search(self):
+        csp = assignment5.create_sudoku_csp_from_string(VERYHARD)
+        self.assertTrue(csp.backtracking_search(node_limit=1000))
+        self.assertEqual(csp.search_stats()['backtrack_calls'], 536)
+        self.assertTrue(csp.backtracking_search(node_limit=1000))
+        self.assertEqual(csp.search_stats()['backtrack_calls'], 536)
+        self.assertEqual(csp.backtrack_calls, 2 * 536)
+
+        partial = csp.backtracking_search(node_limit=500)
+        self.assertEqual(partial.reason, 'node_limit')
+        self.assertEqual(partial.stats['backtrack_calls'], 500)
+
+    def test_count_solutions_after_a_search(self):
+        # Counting the 288 solutions of the empty 4x4 board takes 593
+        # backtrack calls
+        csp = assignment5.create_sudoku_csp_from_string('0' * 16)
+        self.assertTrue(csp.backtracking_search())
+        self.assertEqual(csp.count_solutions(node_limit=594), 288)
+        self.assertEqual(csp.status, 'exhausted')
+        self.assertTrue(csp.count_solutions(node_limit=100) < 288)
+        self.assertEqual(csp.status, 'node_limit')
+        self.assertEqual(csp.search_stats()['backtrack_calls'], 100)
+
+    def test_has_unique_solution_after_a_search(self):
+        csp = assignment5.create_sudoku_csp_from_string(VERYHARD)
+        self.assertTrue(csp.backtracking_search())
+        self.assertTrue(csp.has_unique_solution(node_limit=1000))
+
+
+class ArcConsistencyTest(unittest.TestCase):
+
+    def test_residual_supports_prune_like_revise(self):
+        # Two copies of the domains go through the same removals and
+        # undos, and every arc is revised with revise() in one and with
+        # revise_residual() in the other, so that the remembered supports
+        # go stale when values are put back
+        rng = random.Random(4)
+        for seed in range(5):
+            csp = assignment5.generate_map_coloring_csp(30, 4, 5.0, seed)
+            csp.freeze()
+            csp.last_support = {}
+            plain = assignment5.Domains(csp.domains)
+            residual = assignment5.Domains(csp.domains)
+            marks = []
+            for step in range(40):
+                if marks and rng.random() < 0.3:
+                    mark = marks.pop()
+                    plain.undo(mark)
+                    residual.undo(mark)
+                    continue
+                marks.append(plain.mark())
+                var = rng.choice([ var for var in csp.variables if plain.size(var) > 1 ])
+                value = rng.choice(plain[var])
+                plain.remove(var, value)
+                residual.remove(var, value)
+                for i, j in csp.arcs:
+                    self.assertEqual(csp.revise_residual(residual, i, j),
+                                     csp.revise(plain, i, j))
+                    self.assertEqual(residual, plain)
+                self.assertEqual(len(residual.trail), len(plain.trail))
+
+    def test_ac2001_finds_the_same_solution(self):
+        csp = assignment5.create_sudoku_csp_from_string(VERYHARD)
+        solution = csp.backtracking_search()
+        self.assertEqual(csp.backtracking_search(arc_consistency='ac2001'), solution)
+
+
+class BackjumpingTest(unittest.TestCase):
+
+    def test_backjumping_counts_the_same_solutions(self):
+        counts = []
+        backjumps = 0
+        for seed in range(30):
+            for all_different in (None, 4):
+                csp = random_binary_csp(seed, all_different=all_different)
+                count = csp.count_solutions()
+                self.assertEqual(csp.status, 'exhausted' if count else 'unsatisfiable')
+                for nogood_limit in (0, 3, 10000):
+                    for compact in (False, True):
+                        self.assertEqual(csp.count_solutions(backjumping=True, compact=compact,
+                                                             nogood_limit=nogood_limit),
+                                         count, (seed, all_different, nogood_limit, compact))
+                        backjumps += csp.backjumps
+                counts.append(count)
+        # both kinds of instances, and jumps over more than one level
+        self.assertTrue(0 < counts.count(0) < len(counts))
+        self.assertTrue(backjumps > 0)
+
+    def test_evicted_nogoods_leave_no_watches(self):
+        store = assignment5.NogoodStore(limit=2)
+        store.add([ ('A', 1), ('B', 2) ])
+        store.add([ ('A', 1), ('C', 3) ])
+        store.add([ ('D', 4), ('E', 5) ])
+        store.add([ ('D', 4), ('F', 6) ])
+        self.assertEqual(store.evicted, 2)
+        self.assertEqual(sorted(store.watches), [ ('D', 4), ('E', 5), ('F', 6) ])
+        self.assertEqual(len(store.watches[('D', 4)]), 2)
+
+
+class IntensionalConstraintTest(unittest.TestCase):
+
+    def test_intensional_constraints_search_like_extensional(self):
+        for seed in range(10):
+            for all_different in (None, 4):
+                csp = random_binary_csp(seed, all_different=all_different)
+                solution = csp.backtracking_search()
+                count = csp.count_solutions()
+                for cache_size in (0, 5, 100000):
+                    intensional = random_binary_csp(seed, all_different=all_different,
+                                                    intensional=True, cache_size=cache_size)
+                    for options in ({}, dict(arc_consistency='ac2001'), dict(compact=True)):
+                        self.assertEqual(intensional.backtracking_search(**options), solution,
+                                         (seed, cache_size, options))
+                        self.assertEqual(intensional.count_solutions(**options), count,
+                                         (seed, cache_size, options))
+                    tables = [ table for i in intensional.variables
+                               for table in intensional.constraints[i].values() ]
+                    self.assertTrue(all(len(table.cache) <= cache_size for table in tables))
+
+    def test_schedule_with_intensional_constraints(self):
+        durations = [3, 1, 4, 1, 5]
+        extensional = assignment5.create_scheduling_csp(durations, 20, intensional=False)
+        intensional = assignment5.create_scheduling_csp(durations, 20)
+        self.assertEqual(intensional.backtracking_search(), extensional.backtracking_search())
+        self.assertEqual(intensional.count_solutions(), extensional.count_solutions())
+
+
+class MinConflictsTest(unittest.TestCase):
+
+    def assertSolves(self, csp, solution):
+        self.assertEqual(sorted(solution), sorted(csp.variables))
+        self.assertTrue(all(len(values) == 1 for values in solution.values()))
+        for i in csp.variables:
+            for j, supports in csp.constraints[i].items():
+                self.assertIn((solution[i][0], solution[j][0]), supports)
+
+    def test_min_conflicts_colors_a_map(self):
+        csp = assignment5.generate_map_coloring_csp(200, 4, 4.0, seed=3)
+        solution = csp.min_conflicts(seed=0)
+        self.assertEqual(csp.status, 'solved')
+        self.assertSolves(csp, solution)
+
+    def test_min_conflicts_solves_sudoku(self):
+        for puzzle in (EASY, MEDIUM):
+            csp = assignment5.create_sudoku_csp_from_string(puzzle)
+            solution = csp.min_conflicts(seed=0)
+            self.assertEqual(csp.status, 'solved')
+            self.assertSolves(csp, solution)
+            self.assertEqual(solution, csp.backtracking_search())
+
+    def test_min_conflicts_step_limit(self):
+        csp = assignment5.generate_map_coloring_csp(200, 4, 4.0, seed=3)
+        partial = csp.min_conflicts(max_steps=5, seed=0)
+        self.assertFalse(partial)
+        self.assertTrue(isinstance(partial, assignment5.PartialSolution))
+        self.assertEqual(partial.reason, 'step_limit')
+        self.assertEqual(csp.steps, 5)
+        self.assertTrue(partial.stats['conflicts'] > 0)
+        self.assertEqual(partial.decided(), len(csp.variables))
+
+
+class SudokuBatchTest(unittest.TestCase):
+
+    def solve(self, lines, workers, **search_options):
+        results = sorted(assignment5.solve_sudoku_batch(lines, workers=workers,
+                                                        **search_options))
+        return [ (index, status, solution, error)
+                 for index, status, solution, _, _, _, error in results ]
+
+    def test_malformed_line_in_batch(self):
+        lines = [ EASY + '\n', MEDIUM + '000\n', MEDIUM + '\n' ]
+        for workers in (1, 2):
+            results = self.solve(lines, workers)
+            self.assertEqual([ index for index, _, _, _ in results ], [0, 1, 2])
+            self.assertEqual([ status for _, status, _, _ in results ],
+                             ['solved', 'error', 'solved'])
+            self.assertTrue(results[0][2] and results[0][3] is None)
+            self.assertEqual(results[1][2], None)
+            self.assertIn('got 84', results[1][3])
+            self.assertTrue(results[2][2] and results[2][3] is None)
+
+    def test_unfinished_board_in_batch(self):
+        rows = [ MEDIUM[k:k + 9] + '\n' for k in range(0, 81, 9) ]
+        results = self.solve(rows[:4] + [EASY + '\n'] + rows, 1)
+        self.assertEqual([ status for _, status, _, _ in results ], ['error', 'solved', 'solved'])
+
+    def test_unsolvable_and_stopped_puzzles_in_batch(self):
+        # two 1s in the first row of the easy board
+        unsolvable = '11' + EASY[2:]
+        for workers in (1, 2):
+            results = self.solve([ unsolvable, VERYHARD, EASY ], workers, node_limit=50)
+            self.assertEqual([ status for _, status, _, _ in results ],
+                             ['unsolvable', 'limit', 'solved'])
+            self.assertEqual([ solution is None for _, _, solution, _ in results ],
+                             [True, True, False])
+
+    def test_batch_reads_the_puzzles_as_they_are_solved(self):
+        read = []
+
+        def lines():
+            for k in range(1000):
+                read.append(k)
+                yield EASY
+
+        results = assignment5.solve_sudoku_batch(lines(), workers=2)
+        try:
+            next(results)
+            self.assertTrue(len(read) <= 2 * assignment5.BATCH_QUEUE_CHUNKS)
+        finally:
+            results.close()
+
+    def test_malformed_line_raises_without_errors(self):
+        puzzles = assignment5.read_sudoku_puzzles([ EASY, MEDIUM[:80] ])
+        self.assertEqual(next(puzzles), EASY)
+        self.assertRaises(ValueError, next, puzzles)
+
+
+if __name__ == '__main__':
+    unittest.main()